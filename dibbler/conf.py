@@ -4,10 +4,20 @@ import tomllib
 from pathlib import Path
 from typing import Any
 
+from dibbler.lib.database import SQLITE_PRAGMAS
 from dibbler.lib.helpers import file_is_submissive_and_readable
 
 DEFAULT_CONFIG_PATH = Path("/etc/dibbler/dibbler.toml")
 
+# Settings under [database] which are passed on to create_engine
+ENGINE_OPTIONS = (
+    "pool_size",
+    "max_overflow",
+    "pool_timeout",
+    "pool_recycle",
+    "pool_pre_ping",
+)
+
 
 config: dict[str, dict[str, Any]] = {}
 
@@ -54,3 +64,16 @@ def config_db_string() -> str:
         return f"postgresql+psycopg2://{username}:{password}@{host}:{port}/{dbname}"
     print(f"Error: unknown database type '{db_type}'")
     exit(1)
+
+
+def config_engine_options() -> dict[str, Any]:
+    options: dict[str, Any] = {"pool_pre_ping": True}
+    options.update(
+        (key, value) for key, value in config["database"].items() if key in ENGINE_OPTIONS
+    )
+    return options
+
+
+def config_sqlite_pragmas() -> dict[str, Any]:
+    sqlite_config = config["database"].get("sqlite", {})
+    return {key: value for key, value in sqlite_config.items() if key in SQLITE_PRAGMAS}
@@ -1,16 +1,31 @@
+import hashlib
 import sys
 from pathlib import Path
 
-from sqlalchemy import Engine, create_engine, inspect, select
+from sqlalchemy import Engine, create_engine, delete, insert, inspect, select
 from sqlalchemy.exc import DBAPIError, OperationalError
 from sqlalchemy.orm import RelationshipProperty
 from sqlalchemy.orm.clsregistry import _ModuleMarker
 
 from dibbler.lib.helpers import file_is_submissive_and_readable
-from dibbler.models import Base
+from dibbler.models import Base, Meta
 
+SCHEMA_FINGERPRINT_KEY = "schema_fingerprint"
 
-def check_db_health(engine: Engine, verify_table_existence: bool = False) -> None:
+
+def check_db_health(
+    engine: Engine,
+    verify_table_existence: bool = False,
+    verify_schema: bool = False,
+) -> None:
+    """
+    Check that the database is reachable, and optionally that it has the
+    tables and columns of the models.
+
+    Reflecting the whole schema takes many queries, so it is skipped if
+    the database has a stored fingerprint matching the models, unless
+    `verify_schema` is set.
+    """
     dialect_name = getattr(engine.dialect, "name", "").lower()
 
     if "postgres" in dialect_name:
@@ -20,7 +35,45 @@ def check_db_health(engine: Engine, verify_table_existence: bool = False) -> Non
         check_sqlite_file(engine)
 
     if verify_table_existence:
-        verify_tables_and_columns(engine)
+        if verify_schema or read_schema_fingerprint(engine) != schema_fingerprint():
+            verify_tables_and_columns(engine)
+            store_schema_fingerprint(engine)
+
+
+def schema_fingerprint() -> str:
+    """
+    A hash of the tables and columns declared by the models.
+    """
+    columns = sorted(
+        f"{table.name}.{column.name}"
+        for table in Base.metadata.sorted_tables
+        for column in table.columns
+    )
+    return hashlib.sha256("\n".join(columns).encode()).hexdigest()
+
+
+def read_schema_fingerprint(engine: Engine) -> str | None:
+    try:
+        with engine.connect() as conn:
+            return conn.scalar(select(Meta.value).where(Meta.key == SCHEMA_FINGERPRINT_KEY))
+    except DBAPIError:
+        # Most likely the meta table does not exist yet
+        return None
+
+
+def store_schema_fingerprint(engine: Engine) -> None:
+    """
+    Record that the schema of the database matches the models.
+    """
+    try:
+        with engine.begin() as conn:
+            conn.execute(delete(Meta).where(Meta.key == SCHEMA_FINGERPRINT_KEY))
+            conn.execute(
+                insert(Meta).values(key=SCHEMA_FINGERPRINT_KEY, value=schema_fingerprint()),
+            )
+    except DBAPIError as exc:
+        # Not being able to skip the check next time is not a reason to stop
+        print(f"Could not store the schema fingerprint: {exc}", file=sys.stderr)
 
 
 def check_postgres_ping(engine: Engine) -> None:
@@ -104,5 +157,8 @@ def verify_tables_and_columns(engine: Engine) -> None:
             errors = True
 
     if errors:
-        print("Have you remembered to run `dibbler create-db?", file=sys.stderr)
+        print(
+            "Have you remembered to run `dibbler create-db` or `dibbler migrate`?",
+            file=sys.stderr,
+        )
         sys.exit(1)
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import functools
+import re
+from typing import TYPE_CHECKING, Any, Concatenate, ParamSpec, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Mapping
+
+    from sqlalchemy import Engine, Executable
+    from sqlalchemy.engine.interfaces import DBAPIConnection
+    from sqlalchemy.pool import ConnectionPoolEntry
+
+__all__ = [
+    "SQLITE_PRAGMAS",
+    "ReconnectingSession",
+    "configure_sqlite",
+]
+
+# Pragmas set on every new SQLite connection, unless overridden under [database.sqlite].
+# WAL lets readers, like a statistics report, run while someone is buying, and with
+# synchronous = normal a commit does not have to wait for the WAL to reach the disk.
+SQLITE_PRAGMAS: dict[str, str | int] = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    # Negative sizes are in KiB
+    "cache_size": -16000,
+    "mmap_size": 64 * 1024 * 1024,
+    # How long (in milliseconds) to wait for a lock before failing with "database is locked"
+    "busy_timeout": 5000,
+}
+
+PRAGMA_VALUE_RE = re.compile(r"-?[A-Za-z0-9_]+")
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+def configure_sqlite(engine: Engine, overrides: Mapping[str, Any]) -> None:
+    """
+    Set the pragmas in SQLITE_PRAGMAS, updated with `overrides`, on every
+    connection the engine makes.
+    """
+    pragmas = {**SQLITE_PRAGMAS, **overrides}
+    for key, value in pragmas.items():
+        # Pragmas can not take bound parameters
+        if not PRAGMA_VALUE_RE.fullmatch(str(value)):
+            raise ValueError(f"Invalid value for SQLite pragma {key}: {value!r}")
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(
+        dbapi_connection: DBAPIConnection,
+        _connection_record: ConnectionPoolEntry,
+    ) -> None:
+        cursor = dbapi_connection.cursor()
+        try:
+            for key, value in pragmas.items():
+                cursor.execute(f"PRAGMA {key} = {value}")
+        finally:
+            cursor.close()
+
+
+def _retrying(
+    method: Callable[Concatenate[Session, Executable, P], R],
+) -> Callable[Concatenate[ReconnectingSession, Executable, P], R]:
+    """
+    Wrap a statement running method of Session, keeping its signature, so
+    that it is retried by ReconnectingSession._with_retry.
+    """
+
+    @functools.wraps(method)
+    def retrying(
+        self: ReconnectingSession,
+        statement: Executable,
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> R:
+        return self._with_retry(method, statement, *args, **kwargs)
+
+    return retrying
+
+
+class ReconnectingSession(Session):
+    """
+    Session which retries a statement once if its connection turns out to be dead.
+
+    The kiosk keeps one session for its whole lifetime, so a database restart
+    or an idle connection being dropped by the server would otherwise make
+    the next scan fail. A statement is only retried if nothing has been
+    written in the current transaction, since those writes are lost with
+    the connection, and the unit of work could not be replayed correctly.
+    """
+
+    _has_written = False
+
+    def _mark_written(self, *_args: object) -> None:
+        self._has_written = True
+
+    def _reset_written(self, *_args: object) -> None:
+        self._has_written = False
+
+    def _can_retry(self, error: DBAPIError) -> bool:
+        return (
+            error.connection_invalidated
+            and not self._has_written
+            and not (self.new or self.dirty or self.deleted)
+        )
+
+    def _with_retry(
+        self,
+        method: Callable[Concatenate[Session, Executable, P], R],
+        statement: Executable,
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> R:
+        try:
+            result = method(self, statement, *args, **kwargs)
+        except DBAPIError as e:
+            if not self._can_retry(e):
+                raise
+            # Throw away the dead connection, and start over on a new one
+            self.rollback()
+            result = method(self, statement, *args, **kwargs)
+        if getattr(statement, "is_dml", False):
+            self._has_written = True
+        return result
+
+    execute = _retrying(Session.execute)
+    scalar = _retrying(Session.scalar)
+    scalars = _retrying(Session.scalars)
+
+
+event.listen(ReconnectingSession, "after_flush", ReconnectingSession._mark_written)
+event.listen(ReconnectingSession, "after_commit", ReconnectingSession._reset_written)
+event.listen(ReconnectingSession, "after_rollback", ReconnectingSession._reset_written)
@@ -1,15 +1,19 @@
+import contextlib
 import os
 import pwd
 import signal
 import subprocess
-from collections.abc import Callable
+from collections.abc import Callable, Iterable
 from pathlib import Path
 from typing import Any, Literal
 
-from sqlalchemy import and_, not_, or_
 from sqlalchemy.orm import Session
 
 from ..models import Product, User
+from .lookup_index import get_lookup_index
+
+# Rows fetched at a time by the queries whose output is shown with less
+PAGER_BATCH_SIZE = 200
 
 
 def search_user(
@@ -21,24 +25,11 @@ def search_user(
 ) -> User | list[User] | None:
     assert sql_session is not None
     string = string.lower()
-    exact_match = (
-        sql_session.query(User)
-        .filter(or_(User.name == string, User.card == string, User.rfid == string))
-        .first()
-    )
+    lookup_index = get_lookup_index(sql_session)
+    exact_match = lookup_index.find_user(string, sql_session)
     if exact_match:
         return exact_match
-    return (
-        sql_session.query(User)
-        .filter(
-            or_(
-                User.name.ilike(f"%{string}%"),
-                User.card.ilike(f"%{string}%"),
-                User.rfid.ilike(f"%{string}%"),
-            ),
-        )
-        .all()
-    )
+    return lookup_index.search_users(string, sql_session)
 
 
 def search_product(
@@ -47,54 +38,11 @@ def search_product(
     find_hidden_products: bool = True,
 ) -> Product | list[Product] | None:
     assert sql_session is not None
-    if find_hidden_products:
-        exact_match = (
-            sql_session.query(Product)
-            .filter(or_(Product.bar_code == string, Product.name == string))
-            .first()
-        )
-    else:
-        exact_match = (
-            sql_session.query(Product)
-            .filter(
-                or_(
-                    Product.bar_code == string,
-                    and_(
-                        Product.name == string,
-                        not_(Product.hidden),
-                    ),
-                ),
-            )
-            .first()
-        )
+    lookup_index = get_lookup_index(sql_session)
+    exact_match = lookup_index.find_product(string, sql_session, find_hidden_products)
     if exact_match:
         return exact_match
-    if find_hidden_products:
-        product_list = (
-            sql_session.query(Product)
-            .filter(
-                or_(
-                    Product.bar_code.ilike(f"%{string}%"),
-                    Product.name.ilike(f"%{string}%"),
-                ),
-            )
-            .all()
-        )
-    else:
-        product_list = (
-            sql_session.query(Product)
-            .filter(
-                or_(
-                    Product.bar_code.ilike(f"%{string}%"),
-                    and_(
-                        Product.name.ilike(f"%{string}%"),
-                        not_(Product.hidden),
-                    ),
-                ),
-            )
-            .all()
-        )
-    return product_list
+    return lookup_index.search_products(string, sql_session, find_hidden_products)
 
 
 def system_user_exists(username: str) -> bool:
@@ -141,18 +89,42 @@ def argmax(
     return maxarg
 
 
-def less(string: str) -> None:
+def less(text: str | Iterable[str]) -> None:
     """
-    Run less with string as input; wait until it finishes.
+    Run less with text as input; wait until it finishes.
+
+    The text may also be an iterable of lines, which are written to less as
+    they are produced, so that the first screen is shown before the rest has
+    been fetched. Lines are not produced any further if less is quit early.
     """
+    if isinstance(text, str):
+        text = (text,)
     # If we don't ignore SIGINT while running the `less` process,
     # it will become a zombie when someone presses C-c.
     int_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
-    env = dict(os.environ)
-    env["LESSSECURE"] = "1"
-    proc = subprocess.Popen("less", env=env, encoding="utf-8", stdin=subprocess.PIPE)
-    proc.communicate(string)
-    signal.signal(signal.SIGINT, int_handler)
+    try:
+        env = dict(os.environ)
+        env["LESSSECURE"] = "1"
+        # Line buffered, so that less gets each line as soon as it is written
+        proc = subprocess.Popen(
+            "less",
+            env=env,
+            encoding="utf-8",
+            stdin=subprocess.PIPE,
+            bufsize=1,
+        )
+        try:
+            for line in text:
+                proc.stdin.write(line)
+        except BrokenPipeError:
+            # less was quit before reading everything
+            pass
+        finally:
+            with contextlib.suppress(BrokenPipeError):
+                proc.stdin.close()
+            proc.wait()
+    finally:
+        signal.signal(signal.SIGINT, int_handler)
 
 
 def file_is_submissive_and_readable(file: Path) -> bool:
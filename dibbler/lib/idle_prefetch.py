@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from ..models import Product
+from .lookup_index import get_lookup_index
+from .product_sales import get_product_sales
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+
+__all__ = [
+    "IdlePrefetcher",
+    "get_idle_prefetcher",
+]
+
+DEFAULT_TOP_PRODUCTS = 50
+
+
+class IdlePrefetcher:
+    """
+    Warms up the session while the kiosk waits for input, so that the first
+    scan after a quiet period does not have to wait for the database.
+
+    Every `interval` seconds of waiting, the lookup index is compared
+    against its signature, which also finds out whether the connection has
+    been dropped (and replaces it), the sales counts are brought up to
+    date, and those of the most sold products which the lookup index does
+    not keep already are read. A scan of any of them is then answered from
+    the identity map without a query. The transaction is ended afterwards,
+    so that it does not stay open while the kiosk is idle.
+
+    Nothing is done while the session has changes which are not committed,
+    since a failing statement would then roll them back.
+    """
+
+    def __init__(self, interval: float, top_products: int = DEFAULT_TOP_PRODUCTS) -> None:
+        self.interval = interval
+        self.top_products = top_products
+        # The identity map only holds weak references
+        self._products: list[Product] = []
+
+    def can_prefetch(self, sql_session: Session) -> bool:
+        return not (
+            getattr(sql_session, "_has_written", False)
+            or sql_session.new
+            or sql_session.dirty
+            or sql_session.deleted
+        )
+
+    def prefetch(self, sql_session: Session) -> None:
+        if not self.can_prefetch(sql_session):
+            return
+        try:
+            index = get_lookup_index(sql_session)
+            index.refresh_if_stale(sql_session, force_check=True)
+            sales = get_product_sales(sql_session)
+            sales.refresh(sql_session)
+            products: list[Product] = []
+            missing = []
+            for product_id, _count in sales.counts.most_common(self.top_products):
+                product = index.kept(sql_session, Product, product_id)
+                if product is None:
+                    missing.append(product_id)
+                else:
+                    products.append(product)
+            if missing:
+                # The lookup index keeps the rows as they are loaded
+                products.extend(
+                    sql_session.scalars(
+                        select(Product)
+                        .where(Product.product_id.in_(missing))
+                        .execution_options(populate_existing=True),
+                    ),
+                )
+            self._products = products
+            sql_session.commit()
+        except SQLAlchemyError:
+            # Whatever failed is tried again when it is needed, and reported then
+            if self.can_prefetch(sql_session):
+                sql_session.rollback()
+
+
+def get_idle_prefetcher(sql_session: Session) -> IdlePrefetcher | None:
+    """
+    Get the idle prefetcher belonging to the session, creating it on first
+    use, or None if idle prefetching is not enabled under [cache].
+    """
+    if "idle_prefetch" not in sql_session.info:
+        # Imported here, since load_config replaces the dict
+        from dibbler.conf import config
+
+        cache_config = config.get("cache", {})
+        interval = cache_config.get("idle_prefetch_interval")
+        sql_session.info["idle_prefetch"] = (
+            IdlePrefetcher(
+                interval,
+                top_products=cache_config.get("idle_prefetch_products", DEFAULT_TOP_PRODUCTS),
+            )
+            if interval
+            else None
+        )
+    return sql_session.info["idle_prefetch"]
@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import logging
+import sys
+import time
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from sqlalchemy import event
+
+from ..models import Base
+
+if TYPE_CHECKING:
+    from sqlalchemy import Engine
+    from sqlalchemy.engine import Connection, ExceptionContext, ExecutionContext
+    from sqlalchemy.engine.interfaces import DBAPICursor
+    from sqlalchemy.orm import Session
+
+__all__ = [
+    "Instrumentation",
+    "SlowQueryLog",
+    "get_instrumentation",
+    "setup_instrumentation",
+]
+
+DIBBLER_DIR = Path(__file__).resolve().parent.parent
+
+# Frames in these directories are reported as the call site of a statement ...
+CALL_SITE_DIRS = tuple(str(DIBBLER_DIR / name) + "/" for name in ("menus", "lib"))
+# ... except in these files, which only pass statements on
+CALL_SITE_IGNORED_FILES = (__file__, str(DIBBLER_DIR / "lib" / "database.py"))
+
+DEFAULT_SLOW_QUERY_LOG = "dibbler-slow-queries.log"
+SLOW_QUERY_LOG_MAX_BYTES = 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 3
+MAX_PARAMETERS_LENGTH = 500
+
+
+class MenuMetrics:
+    """
+    Totals for all executions of one menu.
+    """
+
+    def __init__(self) -> None:
+        self.executions = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.busy_time = 0.0
+        self.rows_loaded = 0
+
+
+class Frame:
+    """
+    One execution of a menu, which may still be running.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.started_at = time.perf_counter()
+        self.input_time = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.rows_loaded = 0
+
+    def busy_time(self) -> float:
+        # Time spent waiting for the user is not interesting
+        return time.perf_counter() - self.started_at - self.input_time
+
+
+class Instrumentation:
+    """
+    Counts the statements, time spent in the database and ORM objects loaded
+    for each execution of a menu.
+
+    Menus register their executions with `enter` and `exit`, and the time
+    they spend waiting for input with `add_input_time`. The numbers of an
+    execution include those of the menus it executes, so the main menu
+    accounts for everything. When an execution ends, the totals for its
+    menu are written to `metrics_file` in the Prometheus textfile format,
+    and a summary is printed if `show_metrics` is set.
+
+    Stored purchases are registered with `add_purchase`, along with the
+    number of statements which were used to store them.
+    """
+
+    def __init__(self, metrics_file: Path | None = None, show_metrics: bool = False) -> None:
+        self.metrics_file = metrics_file
+        self.show_metrics = show_metrics
+        self.frames: list[Frame] = []
+        self.metrics: dict[str, MenuMetrics] = {}
+        self.purchases = 0
+        self.purchase_statements = 0
+        self._statement_started_at: list[float] = []
+
+    def attach(self, engine: Engine, sql_session: Session) -> None:
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine, "handle_error", self._handle_error)
+        event.listen(Base, "load", self._loaded, propagate=True)
+        event.listen(Base, "refresh", self._loaded, propagate=True)
+        sql_session.info["instrumentation"] = self
+
+    def _before_cursor_execute(self, *_args: object) -> None:
+        self._statement_started_at.append(time.perf_counter())
+
+    def _after_cursor_execute(self, *_args: object) -> None:
+        elapsed = time.perf_counter() - self._statement_started_at.pop()
+        for frame in self.frames:
+            frame.queries += 1
+            frame.db_time += elapsed
+
+    def _handle_error(self, _context: ExceptionContext) -> None:
+        if self._statement_started_at:
+            self._statement_started_at.pop()
+
+    def _loaded(self, *_args: object) -> None:
+        for frame in self.frames:
+            frame.rows_loaded += 1
+
+    def add_input_time(self, seconds: float) -> None:
+        for frame in self.frames:
+            frame.input_time += seconds
+
+    def add_purchase(self, statements: int) -> None:
+        self.purchases += 1
+        self.purchase_statements += statements
+        if self.show_metrics:
+            print(f"[debug] Purchase stored with {statements} statements")
+
+    def enter(self, name: str) -> None:
+        self.frames.append(Frame(name))
+
+    def exit(self) -> None:
+        frame = self.frames.pop()
+        metrics = self.metrics.setdefault(frame.name, MenuMetrics())
+        metrics.executions += 1
+        metrics.queries += frame.queries
+        metrics.db_time += frame.db_time
+        metrics.busy_time += frame.busy_time()
+        metrics.rows_loaded += frame.rows_loaded
+
+        if self.show_metrics:
+            print(
+                f"[debug] {frame.name}: {frame.queries} queries, "
+                f"{frame.db_time * 1000:.1f} ms in database, "
+                f"{frame.busy_time() * 1000:.1f} ms busy, "
+                f"{frame.rows_loaded} rows loaded",
+            )
+        if self.metrics_file is not None:
+            self.write_metrics()
+
+    def write_metrics(self) -> None:
+        assert self.metrics_file is not None
+        lines = []
+        for metric, help_text, attribute in (
+            ("executions", "Number of times the menu has been executed", "executions"),
+            ("queries", "SQL statements issued while in the menu", "queries"),
+            ("db_seconds", "Time spent waiting for the database while in the menu", "db_time"),
+            ("busy_seconds", "Time spent in the menu, except waiting for input", "busy_time"),
+            ("rows_loaded", "ORM objects loaded while in the menu", "rows_loaded"),
+        ):
+            name = f"dibbler_menu_{metric}_total"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for menu, metrics in sorted(self.metrics.items()):
+                label = menu.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'{name}{{menu="{label}"}} {getattr(metrics, attribute)}')
+        for metric, help_text, value in (
+            ("purchases", "Purchases stored", self.purchases),
+            (
+                "purchase_statements",
+                "SQL statements issued to store purchases",
+                self.purchase_statements,
+            ),
+        ):
+            name = f"dibbler_{metric}_total"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+
+        # Write to a temporary file and rename, so that the collector never sees half a file
+        temporary_file = self.metrics_file.with_name(self.metrics_file.name + ".tmp")
+        temporary_file.write_text("\n".join(lines) + "\n")
+        temporary_file.replace(self.metrics_file)
+
+
+def call_site() -> str:
+    """
+    The innermost frame in dibbler.menus or dibbler.lib on the current stack.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(CALL_SITE_DIRS) and filename not in CALL_SITE_IGNORED_FILES:
+            path = Path(filename).relative_to(DIBBLER_DIR.parent)
+            return f"{path}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "<unknown>"
+
+
+class SlowQueryLog:
+    """
+    Logs statements taking longer than `threshold_ms` milliseconds, with
+    their parameters and the code in dibbler.menus or dibbler.lib which
+    issued them, to a rotating log file.
+    """
+
+    def __init__(self, path: Path, threshold_ms: float) -> None:
+        self.threshold = threshold_ms / 1000
+        self.logger = logging.getLogger("dibbler.slow_queries")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        handler = RotatingFileHandler(
+            path,
+            maxBytes=SLOW_QUERY_LOG_MAX_BYTES,
+            backupCount=SLOW_QUERY_LOG_BACKUPS,
+            encoding="utf-8",
+        )
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        self.logger.addHandler(handler)
+
+    def attach(self, engine: Engine) -> None:
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine, "handle_error", self._handle_error)
+
+    def _before_cursor_execute(self, conn: Connection, *_args: object) -> None:
+        conn.info.setdefault("slow_query_started_at", []).append(time.perf_counter())
+
+    def _handle_error(self, context: ExceptionContext) -> None:
+        # Connecting may fail before there is a connection
+        if context.connection is None:
+            return
+        started_at = context.connection.info.get("slow_query_started_at")
+        if started_at:
+            started_at.pop()
+
+    def _after_cursor_execute(
+        self,
+        conn: Connection,
+        _cursor: DBAPICursor,
+        statement: str,
+        parameters: object,
+        _context: ExecutionContext,
+        executemany: bool,
+    ) -> None:
+        elapsed = time.perf_counter() - conn.info["slow_query_started_at"].pop()
+        if elapsed < self.threshold:
+            return
+        shown_parameters = repr(parameters)
+        if len(shown_parameters) > MAX_PARAMETERS_LENGTH:
+            shown_parameters = shown_parameters[:MAX_PARAMETERS_LENGTH] + "..."
+        self.logger.info(
+            "%.1f ms%s at %s\n%s\nparameters: %s",
+            elapsed * 1000,
+            " (executemany)" if executemany else "",
+            call_site(),
+            statement,
+            shown_parameters,
+        )
+
+
+def get_instrumentation(sql_session: Session) -> Instrumentation | None:
+    return sql_session.info.get("instrumentation")
+
+
+def setup_instrumentation(engine: Engine, sql_session: Session) -> None:
+    """
+    Attach instrumentation and the slow query log to the engine and session,
+    if enabled under [debug].
+    """
+    # Imported here, since load_config replaces the dict
+    from dibbler.conf import config
+
+    debug_config = config.get("debug", {})
+
+    slow_query_ms = debug_config.get("slow_query_ms")
+    if slow_query_ms is not None:
+        slow_query_log = SlowQueryLog(
+            Path(debug_config.get("slow_query_log", DEFAULT_SLOW_QUERY_LOG)),
+            slow_query_ms,
+        )
+        slow_query_log.attach(engine)
+
+    metrics_file = debug_config.get("metrics_file")
+    show_metrics = debug_config.get("show_metrics", False)
+    if metrics_file is None and not show_metrics:
+        return
+    instrumentation = Instrumentation(
+        metrics_file=Path(metrics_file) if metrics_file is not None else None,
+        show_metrics=show_metrics,
+    )
+    instrumentation.attach(engine, sql_session)
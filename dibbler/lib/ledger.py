@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
+
+from sqlalchemy import and_, func, select
+
+from ..models import BalanceSnapshot, Transaction, User
+
+if TYPE_CHECKING:
+    from sqlalchemy import Select
+    from sqlalchemy.orm import Session
+
+__all__ = [
+    "SNAPSHOT_MARGIN",
+    "balances_query",
+    "take_snapshots",
+    "take_snapshots_if_due",
+]
+
+# Transaction times are stamped by the kiosk before the transaction is
+# committed, and by the clock of whichever machine the kiosk runs on. So
+# snapshots are taken this far back, where every transaction stamped before
+# the snapshot has been committed.
+SNAPSHOT_MARGIN = timedelta(hours=1)
+
+DEFAULT_SNAPSHOT_INTERVAL_DAYS = 7
+
+
+def balances_query(at: datetime | None = None) -> Select:
+    """
+    Derive the balance of every user at `at`, or now, from the transaction history.
+
+    Each balance starts from the user's latest snapshot before `at`, if any,
+    and subtracts the transactions after it, so only the transactions since
+    the last snapshot are summed. Rows are `(name, credit, balance)`, where
+    `credit` is the stored credit of the user.
+    """
+    latest = select(BalanceSnapshot.user_name, func.max(BalanceSnapshot.time).label("time"))
+    if at is not None:
+        latest = latest.where(BalanceSnapshot.time <= at)
+    latest = latest.group_by(BalanceSnapshot.user_name).subquery()
+
+    after_snapshot = (latest.c.time.is_(None)) | (Transaction.time > latest.c.time)
+    if at is not None:
+        after_snapshot = and_(after_snapshot, Transaction.time <= at)
+
+    balance = func.coalesce(BalanceSnapshot.credit, 0) - func.coalesce(
+        func.sum(Transaction.amount),
+        0,
+    )
+    return (
+        select(User.name, User.credit, balance.label("balance"))
+        .outerjoin(latest, latest.c.user_name == User.name)
+        .outerjoin(
+            BalanceSnapshot,
+            and_(BalanceSnapshot.user_name == User.name, BalanceSnapshot.time == latest.c.time),
+        )
+        .outerjoin(Transaction, and_(Transaction.user_name == User.name, after_snapshot))
+        .group_by(User.name, User.credit, BalanceSnapshot.credit)
+        .order_by(User.name)
+    )
+
+
+def take_snapshots(sql_session: Session, at: datetime | None = None) -> int:
+    """
+    Store the derived balance of every user at `at` as a snapshot, and
+    return the number of snapshots taken. By default, the snapshots are
+    taken `SNAPSHOT_MARGIN` ago.
+
+    The balances after a snapshot are summed from the transactions with a
+    later time, so a transaction with an earlier time which is committed
+    after the snapshot would never be counted. `at` must therefore be far
+    enough back that no such transaction is still to come.
+    """
+    if at is None:
+        at = datetime.now() - SNAPSHOT_MARGIN
+    rows = sql_session.execute(balances_query(at)).all()
+    for row in rows:
+        sql_session.add(BalanceSnapshot(row.name, at, row.balance))
+    sql_session.commit()
+    return len(rows)
+
+
+def take_snapshots_if_due(sql_session: Session, interval: timedelta | None = None) -> int:
+    """
+    Take snapshots like `take_snapshots` if the latest one is more than
+    `interval` older than they would be, and return the number taken. The
+    interval defaults to `snapshot_interval_days` under [ledger], and no
+    snapshots are taken if that is 0.
+    """
+    if interval is None:
+        # Imported here, since load_config replaces the dict
+        from dibbler.conf import config
+
+        days = config.get("ledger", {}).get(
+            "snapshot_interval_days",
+            DEFAULT_SNAPSHOT_INTERVAL_DAYS,
+        )
+        if not days:
+            return 0
+        interval = timedelta(days=days)
+
+    at = datetime.now() - SNAPSHOT_MARGIN
+    latest = sql_session.scalar(select(func.max(BalanceSnapshot.time)))
+    if latest is not None and at - latest < interval:
+        return 0
+    return take_snapshots(sql_session, at)
@@ -0,0 +1,487 @@
+from __future__ import annotations
+
+import time
+import weakref
+from collections import deque
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy import Integer, Text, cast, event, func, insert, inspect, select, update
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.util import identity_key
+
+from ..models import Meta, Product, User
+from .ngram_index import NgramIndex
+from .purchases import UPSERT_INSERTS
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from sqlalchemy import Connection, ScalarSelect
+    from sqlalchemy.orm import UOWTransaction
+
+__all__ = [
+    "LookupIndex",
+    "get_lookup_index",
+]
+
+DEFAULT_CHECK_INTERVAL = 30.0
+DEFAULT_MAX_AGE = 600.0
+
+# Number of rows last found by an exact match which are kept alive
+RECENT_MATCHES = 200
+
+# Meta rows counting the flushes which changed the keys of products and
+# users, and the flushes which changed them at all
+KEYS_VERSION_KEY = "lookup_keys_version"
+ROWS_VERSION_KEY = "lookup_rows_version"
+KEY_ATTRIBUTES = {Product: ("bar_code", "name"), User: ("name", "card", "rfid")}
+
+
+def bump_version(connection: Connection, key: str) -> None:
+    """
+    Add one to the counter in the Meta row `key`, creating it if it is missing.
+    """
+    table = Meta.__table__
+    bumped = cast(cast(table.c.value, Integer) + 1, Text)
+    upsert = UPSERT_INSERTS.get(connection.dialect.name)
+    if upsert is not None:
+        connection.execute(
+            upsert(table)
+            .values(key=key, value="1")
+            .on_conflict_do_update(index_elements=[table.c.key], set_={"value": bumped}),
+        )
+        return
+    result = connection.execute(update(table).where(table.c.key == key).values(value=bumped))
+    if result.rowcount == 0:
+        connection.execute(insert(table).values(key=key, value="1"))
+
+
+@event.listens_for(Session, "after_flush")
+def _count_changes(sql_session: Session, _flush_context: UOWTransaction) -> None:
+    """
+    Count the flushes which change products or users, in every session, so
+    that the lookup indexes of other terminals notice the changes.
+    """
+    edited = [
+        instance
+        for instance in sql_session.dirty
+        if isinstance(instance, (Product, User)) and sql_session.is_modified(instance)
+    ]
+    added_or_deleted = [
+        instance
+        for instance in (*sql_session.new, *sql_session.deleted)
+        if isinstance(instance, (Product, User))
+    ]
+    if edited or added_or_deleted:
+        connection = sql_session.connection()
+        bump_version(connection, ROWS_VERSION_KEY)
+        if added_or_deleted or any(
+            inspect(instance).attrs[attribute].history.has_changes()
+            for instance in edited
+            for attribute in KEY_ATTRIBUTES[type(instance)]
+        ):
+            bump_version(connection, KEYS_VERSION_KEY)
+
+
+@event.listens_for(Product, "load")
+@event.listens_for(Product, "refresh")
+@event.listens_for(User, "load")
+@event.listens_for(User, "refresh")
+def _keep_loaded(instance: Product | User, *_args: object) -> None:
+    sql_session = object_session(instance)
+    lookup_index = sql_session.info.get("lookup_index") if sql_session is not None else None
+    if lookup_index is not None:
+        lookup_index.keep((instance,))
+
+
+class LookupIndex:
+    """
+    Process-local index of the columns used for exact matches in
+    `search_user` and `search_product`.
+
+    The index maps bar codes, product names, user names, card numbers
+    and RFIDs to primary keys, and keeps track of the rows the session has
+    read, so that a scan of one of them is answered from the identity map
+    without a query. It is kept current through the session's flush/commit
+    events, and compared against a cheap signature at most every
+    `check_interval` seconds, so that changes from another terminal are
+    picked up. Rows added from another terminal are not found before that.
+
+    The signature has two parts. The row counts, the highest product id
+    and the number of flushes which changed a key make up the first, and
+    when it changes the index is loaded again. The number of flushes
+    which changed a product or user, and the sums of the stock and the
+    credit, which purchases and restocks update without a flush, make up
+    the second, and when it changes the kept rows are read again.
+    """
+
+    def __init__(
+        self,
+        check_interval: float = DEFAULT_CHECK_INTERVAL,
+        max_age: float = DEFAULT_MAX_AGE,
+    ) -> None:
+        self.check_interval = check_interval
+        self.max_age = max_age
+
+        self.products_by_bar_code: dict[str, set[int]] = {}
+        self.products_by_name: dict[str, set[int]] = {}
+        self.users_by_name: dict[str, set[str]] = {}
+        self.users_by_card: dict[str, set[str]] = {}
+        self.users_by_rfid: dict[str, set[str]] = {}
+
+        # Search over (bar_code, name) and (name, card, rfid), where only
+        # the names are matched by edit distance
+        self.product_search: NgramIndex[int] = NgramIndex(fuzzy_fields=(1,))
+        self.user_search: NgramIndex[str] = NgramIndex(fuzzy_fields=(0,))
+
+        # Reverse mappings, so that old keys can be removed when a row changes
+        self._product_keys: dict[int, tuple[str | None, str | None]] = {}
+        self._user_keys: dict[str, tuple[str | None, str | None, str | None]] = {}
+
+        # Changes flushed in the current transaction, applied on commit
+        self._pending_products: dict[int, tuple[str | None, str | None] | None] = {}
+        self._pending_users: dict[str, tuple[str | None, str | None, str | None] | None] = {}
+
+        # Rows read by the session since the signature was last found changed,
+        # and strong references to those found last, since both this and the
+        # identity map only hold weak references
+        self._fresh: weakref.WeakValueDictionary[
+            tuple[type[Product] | type[User], int | str],
+            Product | User,
+        ] = weakref.WeakValueDictionary()
+        self._recent: deque[Product | User] = deque(maxlen=RECENT_MATCHES)
+
+        self.signature: tuple[Any, ...] | None = None
+        self.loaded_at: float | None = None
+        self.checked_at: float = 0.0
+
+    @staticmethod
+    def _add_key(index: dict[str, set[Any]], key: str | None, pk: int | str) -> None:
+        if key is not None:
+            index.setdefault(key, set()).add(pk)
+
+    @staticmethod
+    def _remove_key(index: dict[str, set[Any]], key: str | None, pk: int | str) -> None:
+        if key is None or key not in index:
+            return
+        index[key].discard(pk)
+        if not index[key]:
+            del index[key]
+
+    def _set_product(self, pk: int, keys: tuple[str | None, str | None] | None) -> None:
+        old_keys = self._product_keys.pop(pk, None)
+        if old_keys is not None:
+            self._remove_key(self.products_by_bar_code, old_keys[0], pk)
+            self._remove_key(self.products_by_name, old_keys[1], pk)
+        if keys is not None:
+            self._product_keys[pk] = keys
+            self._add_key(self.products_by_bar_code, keys[0], pk)
+            self._add_key(self.products_by_name, keys[1], pk)
+        self.product_search.set(pk, keys)
+
+    def _set_user(self, pk: str, keys: tuple[str | None, str | None, str | None] | None) -> None:
+        old_keys = self._user_keys.pop(pk, None)
+        if old_keys is not None:
+            self._remove_key(self.users_by_name, old_keys[0], pk)
+            self._remove_key(self.users_by_card, old_keys[1], pk)
+            self._remove_key(self.users_by_rfid, old_keys[2], pk)
+        if keys is not None:
+            self._user_keys[pk] = keys
+            self._add_key(self.users_by_name, keys[0], pk)
+            self._add_key(self.users_by_card, keys[1], pk)
+            self._add_key(self.users_by_rfid, keys[2], pk)
+        self.user_search.set(pk, keys)
+
+    def add_product(self, product: Product) -> None:
+        self._set_product(product.product_id, (product.bar_code, product.name))
+
+    def add_user(self, user: User) -> None:
+        self._set_user(user.name, (user.name, user.card, user.rfid))
+
+    def add(self, instance: Product | User) -> None:
+        if isinstance(instance, Product):
+            self.add_product(instance)
+        else:
+            self.add_user(instance)
+
+    @staticmethod
+    def query_signature(sql_session: Session) -> tuple[Any, ...]:
+        """
+        Get the signature of the tables, with the part which changes with the
+        keys first, and the part which changes with the other columns last.
+        """
+
+        def version(key: str) -> ScalarSelect[str]:
+            return select(Meta.value).where(Meta.key == key).scalar_subquery()
+
+        return tuple(
+            sql_session.execute(
+                select(
+                    select(func.count()).select_from(Product).scalar_subquery(),
+                    select(func.max(Product.product_id)).scalar_subquery(),
+                    select(func.count()).select_from(User).scalar_subquery(),
+                    version(KEYS_VERSION_KEY),
+                    version(ROWS_VERSION_KEY),
+                    select(func.sum(Product.stock)).scalar_subquery(),
+                    select(func.sum(User.credit)).scalar_subquery(),
+                ),
+            ).one(),
+        )
+
+    def load(self, sql_session: Session, signature: tuple[Any, ...] | None = None) -> None:
+        """
+        (Re)build the whole index, using one query per table, and one for the
+        signature unless it has just been read.
+        """
+        self.products_by_bar_code.clear()
+        self.products_by_name.clear()
+        self.users_by_name.clear()
+        self.users_by_card.clear()
+        self.users_by_rfid.clear()
+        self._product_keys.clear()
+        self._user_keys.clear()
+        self.product_search.clear()
+        self.user_search.clear()
+
+        self.signature = signature or self.query_signature(sql_session)
+        for pk, bar_code, name in sql_session.execute(
+            select(Product.product_id, Product.bar_code, Product.name),
+        ):
+            self._set_product(pk, (bar_code, name))
+        for name, card, rfid in sql_session.execute(select(User.name, User.card, User.rfid)):
+            self._set_user(name, (name, card, rfid))
+
+        self.loaded_at = self.checked_at = time.monotonic()
+
+    def refresh_if_stale(self, sql_session: Session, force_check: bool = False) -> None:
+        """
+        Load the index again if it is too old, or compare it against the
+        signature if it has not been for `check_interval` seconds, or if
+        `force_check` is set.
+        """
+        now = time.monotonic()
+        if self.loaded_at is None or now - self.loaded_at >= self.max_age:
+            self.load(sql_session)
+            self.reread(sql_session)
+            return
+        if not force_check and now - self.checked_at < self.check_interval:
+            return
+        self.checked_at = now
+        signature = self.query_signature(sql_session)
+        if signature == self.signature:
+            return
+        if self.signature is None or signature[:4] != self.signature[:4]:
+            self.load(sql_session, signature)
+        else:
+            self.signature = signature
+        self.reread(sql_session)
+
+    def reread(self, sql_session: Session) -> None:
+        """
+        Read the kept rows again, with one query per table, leaving out those
+        with changes in this session.
+        """
+        fresh = {
+            key: instance
+            for key, instance in list(self._fresh.items())
+            if not inspect(instance).modified
+        }
+        self._fresh.clear()
+        for klass, column in ((Product, Product.product_id), (User, User.name)):
+            pks = [pk for k, pk in fresh if k is klass]
+            if pks:
+                # The rows are kept again as they are loaded
+                sql_session.scalars(
+                    select(klass).where(column.in_(pks)).execution_options(populate_existing=True),
+                ).all()
+
+    def keep(self, instances: Iterable[Product | User]) -> None:
+        """
+        Keep rows which have just been read by the session, so that exact
+        matches of them are answered without a query until the signature
+        changes, for as long as something else refers to them.
+        """
+        for instance in instances:
+            klass, (pk,), _token = identity_key(instance=instance)
+            self._fresh[(klass, pk)] = instance
+
+    def kept(
+        self,
+        sql_session: Session,
+        klass: type[Product] | type[User],
+        pk: int | str,
+    ) -> Product | User | None:
+        """
+        Get the kept row with the given primary key, or None if it has not
+        been read since the signature was last found changed.
+        """
+        instance = self._fresh.get((klass, pk))
+        if instance is None:
+            return None
+        state = inspect(instance)
+        if state.session is not sql_session or state.expired_attributes:
+            return None
+        return instance
+
+    def _lookup(
+        self,
+        sql_session: Session,
+        klass: type[Product] | type[User],
+        index: dict[str, set[Any]],
+        attribute: str,
+        key: str,
+    ) -> Product | User | None:
+        for pk in sorted(index.get(key, ())):
+            instance = self.kept(sql_session, klass, pk)
+            if instance is None:
+                instance = sql_session.identity_map.get(identity_key(klass, pk))
+                # Uncommitted edits in this session are applied to the index on commit
+                if instance is None or not inspect(instance).modified:
+                    instance = sql_session.get(klass, pk, populate_existing=True)
+            if instance is None:
+                self._reindex(klass, pk, None)
+            elif getattr(instance, attribute) == key:
+                self._recent.append(instance)
+                return instance
+            elif not inspect(instance).modified:
+                self._reindex(klass, pk, instance)
+        return None
+
+    def _reindex(
+        self,
+        klass: type[Product] | type[User],
+        pk: int | str,
+        instance: Product | User | None,
+    ) -> None:
+        if instance is not None:
+            self.add(instance)
+        elif klass is Product:
+            self._set_product(pk, None)
+        else:
+            self._set_user(pk, None)
+
+    def find_product(
+        self,
+        string: str,
+        sql_session: Session,
+        find_hidden_products: bool = True,
+    ) -> Product | None:
+        self.refresh_if_stale(sql_session)
+        product = self._lookup(sql_session, Product, self.products_by_bar_code, "bar_code", string)
+        if product is not None:
+            return product
+        product = self._lookup(sql_session, Product, self.products_by_name, "name", string)
+        if product is not None and (find_hidden_products or not product.hidden):
+            return product
+        return None
+
+    def find_user(self, string: str, sql_session: Session) -> User | None:
+        self.refresh_if_stale(sql_session)
+        for index, attribute in (
+            (self.users_by_name, "name"),
+            (self.users_by_card, "card"),
+            (self.users_by_rfid, "rfid"),
+        ):
+            user = self._lookup(sql_session, User, index, attribute, string)
+            if user is not None:
+                return user
+        return None
+
+    def search_products(
+        self,
+        string: str,
+        sql_session: Session,
+        find_hidden_products: bool = True,
+    ) -> list[Product]:
+        """
+        Find products whose bar code or name resembles `string`, best match first.
+
+        Hidden products are only included if `find_hidden_products` is set,
+        or if they matched on bar code.
+        """
+        self.refresh_if_stale(sql_session)
+        matches = self.product_search.search(string)
+        if not matches:
+            return []
+        products = {
+            product.product_id: product
+            for product in sql_session.query(Product).filter(
+                Product.product_id.in_([pk for pk, _rank, _field in matches]),
+            )
+        }
+        result = []
+        for pk, _rank, field_index in matches:
+            product = products.get(pk)
+            if product is None:
+                continue
+            # Field 0 is the bar code, which finds hidden products too
+            if product.hidden and not find_hidden_products and field_index != 0:
+                continue
+            result.append(product)
+        return result
+
+    def search_users(self, string: str, sql_session: Session) -> list[User]:
+        """
+        Find users whose name, card number or RFID resembles `string`, best match first.
+        """
+        self.refresh_if_stale(sql_session)
+        matches = self.user_search.search(string)
+        if not matches:
+            return []
+        users = {
+            user.name: user
+            for user in sql_session.query(User).filter(
+                User.name.in_([pk for pk, _rank, _field in matches]),
+            )
+        }
+        return [users[pk] for pk, _rank, _field in matches if pk in users]
+
+    def _after_flush(self, sql_session: Session, _flush_context: UOWTransaction) -> None:
+        for instance in list(sql_session.new) + list(sql_session.dirty):
+            if isinstance(instance, Product):
+                self._pending_products[instance.product_id] = (instance.bar_code, instance.name)
+            elif isinstance(instance, User):
+                self._pending_users[instance.name] = (instance.name, instance.card, instance.rfid)
+        for instance in sql_session.deleted:
+            if isinstance(instance, Product):
+                self._pending_products[instance.product_id] = None
+            elif isinstance(instance, User):
+                self._pending_users[instance.name] = None
+
+    def _after_commit(self, _sql_session: Session) -> None:
+        for pk, product_keys in self._pending_products.items():
+            self._set_product(pk, product_keys)
+        for pk, user_keys in self._pending_users.items():
+            self._set_user(pk, user_keys)
+        self._discard_pending()
+
+    def _after_rollback(self, _sql_session: Session) -> None:
+        self._discard_pending()
+
+    def _discard_pending(self) -> None:
+        self._pending_products.clear()
+        self._pending_users.clear()
+
+    def attach(self, sql_session: Session) -> None:
+        event.listen(sql_session, "after_flush", self._after_flush)
+        event.listen(sql_session, "after_commit", self._after_commit)
+        event.listen(sql_session, "after_rollback", self._after_rollback)
+
+
+def get_lookup_index(sql_session: Session) -> LookupIndex:
+    """
+    Get the lookup index belonging to the session, creating it on first use.
+    """
+    index = sql_session.info.get("lookup_index")
+    if index is None:
+        # dibbler.conf imports this module (through dibbler.lib.helpers)
+        from dibbler.conf import config
+
+        cache_config = config.get("cache", {})
+        index = LookupIndex(
+            check_interval=cache_config.get("lookup_check_interval", DEFAULT_CHECK_INTERVAL),
+            max_age=cache_config.get("lookup_max_age", DEFAULT_MAX_AGE),
+        )
+        index.attach(sql_session)
+        sql_session.info["lookup_index"] = index
+    return index
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+from collections import Counter
+from collections.abc import Hashable, Iterable, Iterator
+from typing import Generic, TypeVar
+
+__all__ = [
+    "NgramIndex",
+    "approximate_substring_distance",
+]
+
+K = TypeVar("K", bound=Hashable)
+
+N = 3
+
+RANK_EXACT = 0
+RANK_PREFIX = 1
+RANK_SUBSTRING = 2
+RANK_FUZZY = 3
+
+
+# The fuzzy search looks candidates up by the bigrams of the query's pieces
+FUZZY_N = 2
+
+
+def ngrams(string: str, n: int = N) -> Iterator[str]:
+    for i in range(len(string) - n + 1):
+        yield string[i : i + n]
+
+
+def split_query(query: str, parts: int) -> list[tuple[int, str]]:
+    """
+    Split `query` into `parts` pieces of nearly equal length, as `(offset, piece)`.
+    """
+    size, extra = divmod(len(query), parts)
+    pieces = []
+    offset = 0
+    for i in range(parts):
+        length = size + (i < extra)
+        pieces.append((offset, query[offset : offset + length]))
+        offset += length
+    return pieces
+
+
+def approximate_substring_distance(needle: str, haystack: str) -> int:
+    """
+    The smallest edit distance between `needle` and any substring of `haystack`.
+
+    This is the usual Levenshtein recurrence, except that a match may start
+    and end anywhere in `haystack` for free. It is computed a column at a
+    time with Myers' bit-parallel algorithm, with one bit per character of
+    `needle`.
+    """
+    if not needle:
+        return 0
+    mask = (1 << len(needle)) - 1
+    last = 1 << (len(needle) - 1)
+    peq: dict[str, int] = {}
+    for i, char in enumerate(needle):
+        peq[char] = peq.get(char, 0) | (1 << i)
+
+    # Vertical deltas of the current column, as positive and negative bits
+    pv = mask
+    mv = 0
+    score = best = len(needle)
+    for char in haystack:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        best = min(best, score)
+        ph = (ph << 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return best
+
+
+def fuzzy_distance(query: str, field: str, max_distance: int) -> int | None:
+    """
+    The smallest edit distance, if at most `max_distance`, between `query`
+    and any substring of `field`.
+
+    A match within `max_distance` edits leaves at least one of
+    `max_distance + 1` pieces of the query untouched, so the distance is
+    only computed in the windows around where a piece occurs in `field`.
+    """
+    best: int | None = None
+    for offset, piece in split_query(query, max_distance + 1):
+        position = field.find(piece)
+        while position >= 0:
+            start = max(0, position - offset - max_distance)
+            end = position - offset + len(query) + max_distance
+            distance = approximate_substring_distance(query, field[start:end])
+            if distance <= max_distance and (best is None or distance < best):
+                best = distance
+            position = field.find(piece, position + 1)
+    return best
+
+
+def max_distance_for(query: str) -> int:
+    # One typo per four characters, and none for very short queries
+    return len(query) // 4
+
+
+class NgramIndex(Generic[K]):
+    """
+    Case-insensitive trigram index over one or more string fields per key.
+
+    `search` ranks the keys whose fields match a query: exact matches
+    first, then prefix matches, then substring matches, and finally
+    matches within a small edit distance of some substring of a field.
+    Only the fields listed in `fuzzy_fields` are matched by edit distance,
+    so that identifiers like bar codes and card numbers never match a
+    query which is one digit off.
+    """
+
+    def __init__(self, fuzzy_fields: Iterable[int] = ()) -> None:
+        self.fuzzy_fields = tuple(fuzzy_fields)
+        self._fields: dict[K, tuple[str | None, ...]] = {}
+        self._postings: dict[str, set[K]] = {}
+        # Bigrams of the fuzzy fields
+        self._fuzzy_postings: dict[str, set[K]] = {}
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def clear(self) -> None:
+        self._fields.clear()
+        self._postings.clear()
+        self._fuzzy_postings.clear()
+
+    def _fuzzy_field_values(self, fields: tuple[str | None, ...]) -> Iterator[str]:
+        for field_index in self.fuzzy_fields:
+            if field_index < len(fields) and fields[field_index] is not None:
+                yield fields[field_index]
+
+    def set(self, key: K, fields: Iterable[str | None] | None) -> None:
+        self.remove(key)
+        if fields is None:
+            return
+        lowered = tuple(field.lower() if field is not None else None for field in fields)
+        self._fields[key] = lowered
+        for field in lowered:
+            if field is None:
+                continue
+            for gram in ngrams(field):
+                self._postings.setdefault(gram, set()).add(key)
+        for field in self._fuzzy_field_values(lowered):
+            for gram in ngrams(field, FUZZY_N):
+                self._fuzzy_postings.setdefault(gram, set()).add(key)
+
+    @staticmethod
+    def _discard(postings: dict[str, set[K]], grams: Iterable[str], key: K) -> None:
+        for gram in grams:
+            posting = postings.get(gram)
+            if posting is None:
+                continue
+            posting.discard(key)
+            if not posting:
+                del postings[gram]
+
+    def remove(self, key: K) -> None:
+        fields = self._fields.pop(key, None)
+        if fields is None:
+            return
+        for field in fields:
+            if field is not None:
+                self._discard(self._postings, ngrams(field), key)
+        for field in self._fuzzy_field_values(fields):
+            self._discard(self._fuzzy_postings, ngrams(field, FUZZY_N), key)
+
+    def _substring_candidates(self, query: str) -> Iterable[K]:
+        grams = set(ngrams(query))
+        if not grams:
+            # Too short to have any trigrams, so look at everything
+            return self._fields.keys()
+        postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+        return set.intersection(*postings)
+
+    def _fuzzy_candidates(self, query: str, max_distance: int) -> Iterable[K]:
+        # One of max_distance + 1 pieces of the query is not touched by any
+        # edit, so a match contains all the bigrams of at least one piece
+        candidates: set[K] = set()
+        for _offset, piece in split_query(query, max_distance + 1):
+            postings = [
+                self._fuzzy_postings.get(gram, set()) for gram in set(ngrams(piece, FUZZY_N))
+            ]
+            if postings:
+                candidates |= set.intersection(*sorted(postings, key=len))
+
+        # Each edit destroys at most FUZZY_N of the query's bigrams
+        grams = set(ngrams(query, FUZZY_N))
+        required = len(grams) - FUZZY_N * max_distance
+        if required <= 1 or not candidates:
+            return candidates
+        counts: Counter[K] = Counter()
+        for gram in grams:
+            counts.update(candidates.intersection(self._fuzzy_postings.get(gram, ())))
+        return [key for key, count in counts.items() if count >= required]
+
+    def search(self, query: str) -> list[tuple[K, int, int]]:
+        """
+        Find the keys matching `query`, best match first.
+
+        Returns tuples of `(key, rank, field_index)`, where `rank` is one of
+        the `RANK_*` constants and `field_index` is the field that matched best.
+        """
+        query = query.lower()
+        scored: dict[K, tuple[tuple[int, int, int, str], int]] = {}
+
+        def consider(key: K, score: tuple[int, int, int, str], field_index: int) -> None:
+            if key not in scored or score < scored[key][0]:
+                scored[key] = (score, field_index)
+
+        for key in self._substring_candidates(query):
+            for field_index, field in enumerate(self._fields[key]):
+                if field is None:
+                    continue
+                position = field.find(query)
+                if position < 0:
+                    continue
+                if field == query:
+                    rank = RANK_EXACT
+                elif position == 0:
+                    rank = RANK_PREFIX
+                else:
+                    rank = RANK_SUBSTRING
+                consider(key, (rank, position, len(field), field), field_index)
+
+        max_distance = max_distance_for(query)
+        if max_distance > 0:
+            for key in self._fuzzy_candidates(query, max_distance):
+                if key in scored:
+                    continue
+                fields = self._fields[key]
+                for field_index in self.fuzzy_fields:
+                    field = fields[field_index] if field_index < len(fields) else None
+                    if field is None:
+                        continue
+                    distance = fuzzy_distance(query, field, max_distance)
+                    if distance is not None:
+                        consider(key, (RANK_FUZZY, distance, len(field), field), field_index)
+
+        ranked = sorted(scored.items(), key=lambda item: item[1][0])
+        return [(key, score[0], field_index) for key, (score, field_index) in ranked]
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+from collections import Counter
+from typing import TYPE_CHECKING
+
+from sqlalchemy import func, select
+
+from ..models import Product, PurchaseEntry
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+
+__all__ = [
+    "ProductSales",
+    "get_product_sales",
+]
+
+# Entries with ids this close to the newest one are counted one by one, since
+# entries inserted by concurrent transactions may become visible out of order
+REORDER_WINDOW = 500
+
+
+class ProductSales:
+    """
+    Process-local count of how many of each product has been sold, which is
+    the sum of the positive purchase entries of the product.
+
+    The history is aggregated once, and after that only the entries added
+    since the last read are folded in. Entries up to `settled`, which is
+    `REORDER_WINDOW` ids below the newest entry seen, are counted by a
+    grouped query. The newer entries are counted one by one and remembered,
+    so that an entry which appears late, below ids already seen, is still
+    counted exactly once. When no entries have been added, reading the
+    counts costs one count over the newest entries.
+    """
+
+    def __init__(self) -> None:
+        self.counts: Counter[int] = Counter()
+        self.settled = 0
+        # Entries above `settled` which have been counted, as id -> (product id, amount)
+        self.recent: dict[int, tuple[int, int]] = {}
+
+    def refresh(self, sql_session: Session) -> None:
+        sold = PurchaseEntry.amount > 0
+        latest, unsettled = sql_session.execute(
+            select(func.max(PurchaseEntry.id), func.count()).where(
+                PurchaseEntry.id > self.settled,
+                sold,
+            ),
+        ).one()
+        if latest is None or unsettled == len(self.recent):
+            return
+
+        settled = max(self.settled, latest - REORDER_WINDOW)
+        if settled > self.settled:
+            for product_id, amount in sql_session.execute(
+                select(PurchaseEntry.product_id, func.sum(PurchaseEntry.amount))
+                .where(PurchaseEntry.id > self.settled, PurchaseEntry.id <= settled, sold)
+                .group_by(PurchaseEntry.product_id),
+            ):
+                self.counts[product_id] += amount
+            # These were counted one by one, and again by the grouped query
+            for entry_id in [entry_id for entry_id in self.recent if entry_id <= settled]:
+                product_id, amount = self.recent.pop(entry_id)
+                self.counts[product_id] -= amount
+            self.settled = settled
+
+        for entry_id, product_id, amount in sql_session.execute(
+            select(PurchaseEntry.id, PurchaseEntry.product_id, PurchaseEntry.amount).where(
+                PurchaseEntry.id > self.settled,
+                sold,
+            ),
+        ):
+            if entry_id not in self.recent:
+                self.recent[entry_id] = (product_id, amount)
+                self.counts[product_id] += amount
+
+    def ranked(self, sql_session: Session, by_revenue: bool = False) -> list[tuple[Product, int]]:
+        """
+        The products which have been sold, with the number sold, the most
+        sold first, or the most revenue (number sold times the current
+        price) first if `by_revenue` is set.
+
+        The products are read again, so that changed names and prices show.
+        """
+        self.refresh(sql_session)
+        products = sql_session.scalars(
+            select(Product).execution_options(populate_existing=True),
+        ).all()
+        sold = [
+            (product, self.counts[product.product_id])
+            for product in products
+            if self.counts.get(product.product_id, 0) > 0
+        ]
+        if by_revenue:
+            sold.sort(key=lambda row: row[1] * row[0].price, reverse=True)
+        else:
+            sold.sort(key=lambda row: row[1], reverse=True)
+        return sold
+
+
+def get_product_sales(sql_session: Session) -> ProductSales:
+    """
+    Get the product sales belonging to the session, creating them on first use.
+    """
+    sales = sql_session.info.get("product_sales")
+    if sales is None:
+        sales = ProductSales()
+        sql_session.info["product_sales"] = sales
+    return sales
@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import functools
+from collections import Counter
+from datetime import datetime
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy import Insert, case, event, insert, inspect, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from ..models import Product, Purchase, PurchaseEntry, Transaction, User, UserProducts
+
+if TYPE_CHECKING:
+    from sqlalchemy import Column
+    from sqlalchemy.orm import Session
+
+__all__ = [
+    "commit_purchase",
+]
+
+# Dialects with multi-row INSERT ... RETURNING and INSERT ... ON CONFLICT
+UPSERT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+class StatementCounter:
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __call__(self, *_args: object) -> None:
+        self.count += 1
+
+
+def commit_purchase(
+    sql_session: Session,
+    purchase: Purchase,
+    ignore_penalty: bool = False,
+    round_up: bool = True,
+) -> int:
+    """
+    Perform and commit a new purchase, and return the number of statements used.
+
+    Instead of letting the flush insert every transaction and entry and
+    update every user and product on its own, the purchase is stored with a
+    fixed number of statements, however many buyers and products it has:
+    one multi-row INSERT ... RETURNING for each of the purchase, its
+    transactions and its entries, one UPDATE for the credits and one for
+    the stock, keyed by primary key with a CASE, and one upsert of the
+    per-user product counters. The objects are then attached to the session
+    as if they had been loaded.
+
+    Purchases this can not be done for, like those of users who are not in
+    the database yet, are performed and flushed the usual way.
+    """
+    connection = sql_session.connection()
+    counter = StatementCounter()
+    event.listen(connection, "before_cursor_execute", counter)
+    try:
+        # Things added while searching, like a new user, must be stored first. Other
+        # changes, like the products' entries collections, are flushed on commit.
+        if sql_session.new:
+            sql_session.flush(list(sql_session.new))
+        if not can_store_directly(purchase):
+            purchase.perform_purchase(ignore_penalty=ignore_penalty, round_up=round_up)
+            sql_session.add(purchase)
+            sql_session.flush()
+            update_user_products(sql_session, purchase)
+        else:
+            store_purchase(sql_session, purchase, ignore_penalty, round_up)
+    finally:
+        event.remove(connection, "before_cursor_execute", counter)
+    sql_session.commit()
+    return counter.count
+
+
+def can_store_directly(purchase: Purchase) -> bool:
+    things = [purchase, *purchase.transactions, *purchase.entries]
+    return (
+        all(inspect(thing).transient for thing in things)
+        and all(inspect(t.user).persistent for t in purchase.transactions)
+        and all(inspect(entry.product).persistent for entry in purchase.entries)
+    )
+
+
+def store_purchase(
+    sql_session: Session,
+    purchase: Purchase,
+    ignore_penalty: bool,
+    round_up: bool,
+) -> None:
+    transactions = list(purchase.transactions)
+    entries = list(purchase.entries)
+
+    purchase.time = datetime.now()
+    purchase.set_price(round_up=round_up)
+    for t in transactions:
+        t.time = purchase.time
+        if not ignore_penalty:
+            t.amount *= t.penalty
+
+    # The statements are on the tables rather than the models, and take their
+    # values as parameters, so that they are compiled once and cached. The
+    # multi-row inserts are sent as one statement by insertmanyvalues.
+    purchases_table = Purchase.__table__
+    purchase.id = sql_session.execute(
+        insert(purchases_table).returning(purchases_table.c.id),
+        {"time": purchase.time, "price": purchase.price},
+    ).scalar_one()
+
+    # The order of the returned rows is not guaranteed, so they are matched
+    # with the objects by their values. Objects with the same values are
+    # interchangeable.
+    unassigned: dict[tuple, list[Transaction]] = {}
+    for t in transactions:
+        t.user_name = t.user.name
+        t.purchase_id = purchase.id
+        unassigned.setdefault((t.user_name, t.amount, t.penalty), []).append(t)
+    transactions_table = Transaction.__table__
+    for row in sql_session.execute(
+        insert(transactions_table).returning(
+            transactions_table.c.id,
+            transactions_table.c.user_name,
+            transactions_table.c.amount,
+            transactions_table.c.penalty,
+        ),
+        [
+            {
+                "time": t.time,
+                "amount": t.amount,
+                "penalty": t.penalty,
+                "description": t.description,
+                "user_name": t.user_name,
+                "purchase_id": purchase.id,
+            }
+            for t in transactions
+        ],
+    ):
+        unassigned[(row.user_name, row.amount, row.penalty)].pop().id = row.id
+
+    unassigned_entries: dict[tuple, list[PurchaseEntry]] = {}
+    for entry in entries:
+        entry.product_id = entry.product.product_id
+        entry.purchase_id = purchase.id
+        unassigned_entries.setdefault((entry.product_id, entry.amount), []).append(entry)
+    entries_table = PurchaseEntry.__table__
+    for row in sql_session.execute(
+        insert(entries_table).returning(
+            entries_table.c.id,
+            entries_table.c.product_id,
+            entries_table.c.amount,
+        ),
+        [
+            {"amount": entry.amount, "product_id": entry.product_id, "purchase_id": purchase.id}
+            for entry in entries
+        ],
+    ):
+        unassigned_entries[(row.product_id, row.amount)].pop().id = row.id
+
+    credit_changes: Counter[str] = Counter()
+    users = {}
+    for t in transactions:
+        credit_changes[t.user.name] -= t.amount
+        users[t.user.name] = t.user
+    for name, credit in increment_all(sql_session, User.__table__.c.name, "credit", credit_changes):
+        set_committed_value(users[name], "credit", credit)
+
+    stock: Counter[int] = Counter()
+    products = {}
+    for entry in entries:
+        stock[entry.product_id] -= entry.amount
+        products[entry.product_id] = entry.product
+    for product_id, new_stock in increment_all(
+        sql_session,
+        Product.__table__.c.product_id,
+        "stock",
+        stock,
+    ):
+        set_committed_value(products[product_id], "stock", new_stock)
+
+    update_user_products(sql_session, purchase)
+
+    for thing in (purchase, *transactions, *entries):
+        make_transient_to_detached(thing)
+    sql_session.add(purchase)
+
+
+def increment_all(
+    sql_session: Session,
+    key: Column[Any],
+    column_name: str,
+    amounts: dict[Any, int],
+) -> list[Any]:
+    """
+    Add amounts[k] to the column of the row where `key` is k, for every k in
+    one statement, and return the rows as (key, new value).
+    """
+    column = key.table.c[column_name]
+    return sql_session.execute(
+        update(key.table)
+        .where(key.in_(list(amounts)))
+        .values({column: column + case(amounts, value=key)})
+        .returning(key, column),
+    ).all()
+
+
+@functools.cache
+def user_products_upsert(dialect_name: str) -> Insert:
+    table = UserProducts.__table__
+    statement = UPSERT_INSERTS[dialect_name](table)
+    new_count = table.c.count + statement.excluded.count
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.user_name, table.c.product_id],
+        set_={
+            "count": new_count,
+            "sign": case((new_count > 0, 1), (new_count < 0, -1), else_=0),
+        },
+    ).returning(table.c.user_name, table.c.product_id, table.c.count)
+
+
+def update_user_products(sql_session: Session, purchase: Purchase) -> None:
+    """
+    Add the entries of a stored purchase to each buyer's product counters in
+    one upsert, so that purchases made at the same time at other terminals
+    are added to the counts instead of overwriting them.
+    """
+    counts: Counter[tuple[str, int]] = Counter()
+    for t in purchase.transactions:
+        for entry in purchase.entries:
+            counts[(t.user_name, entry.product_id)] += entry.amount
+
+    parameters = [
+        {
+            "user_name": user_name,
+            "product_id": product_id,
+            "count": count,
+            "sign": (count > 0) - (count < 0),
+        }
+        for (user_name, product_id), count in counts.items()
+    ]
+
+    for user_name, product_id, count in sql_session.execute(
+        user_products_upsert(sql_session.connection().dialect.name),
+        parameters,
+    ):
+        ref = sql_session.identity_map.get(identity_key(UserProducts, (user_name, product_id)))
+        if ref is not None:
+            set_committed_value(ref, "count", count)
+            set_committed_value(ref, "sign", (count > 0) - (count < 0))
+
+    # Counters which were not loaded before are loaded again when needed
+    for t in purchase.transactions:
+        sql_session.expire(t.user, ["products"])
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+from datetime import date
+from typing import TYPE_CHECKING
+
+from sqlalchemy import and_, case, func, not_, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+from ..models import CreditRollup, Meta, PurchaseEntry, PurchaseRollup, Transaction
+
+if TYPE_CHECKING:
+    from sqlalchemy import ColumnElement, Select
+    from sqlalchemy.orm import Session
+
+__all__ = [
+    "OUTLIER_LIMIT",
+    "TRANSACTION_REORDER_WINDOW",
+    "as_date",
+    "credit_lines_query",
+    "purchase_lines_query",
+    "update_rollups",
+]
+
+# Every transaction with an id up to this has been folded into the rollups
+WATERMARK_KEY = "rollups_last_transaction_id"
+# The transactions with higher ids which have been folded, as comma separated ids
+RECENT_KEY = "rollups_recent_transaction_ids"
+
+# Transactions larger than this are considered mistakes, and are left out
+OUTLIER_LIMIT = 90000
+
+# Transactions with ids this close to the newest one are folded one by one, since
+# transactions inserted by concurrent sessions may become visible out of order
+TRANSACTION_REORDER_WINDOW = 500
+
+
+def as_date(day: date | str) -> date:
+    # func.date() gives a date on Postgres, but an ISO formatted string on SQLite
+    if isinstance(day, str):
+        return date.fromisoformat(day)
+    return day
+
+
+def purchase_lines_query(*conditions: ColumnElement[bool]) -> Select:
+    """
+    Sum the lines of the purchases matching `conditions` per day, user and product.
+
+    Every purchase entry counts as one line for each buyer, and the amount
+    paid by a buyer is attributed to the first entry of the purchase.
+    """
+    first_entry = aliased(PurchaseEntry)
+    is_first = (
+        PurchaseEntry.id
+        == select(func.min(first_entry.id))
+        .where(first_entry.purchase_id == PurchaseEntry.purchase_id)
+        .scalar_subquery()
+    )
+    is_outlier = func.abs(Transaction.amount) > OUTLIER_LIMIT
+    # The outlier check is only relevant to the line carrying the amount
+    lines = func.sum(case((and_(is_first, is_outlier), 0), else_=1))
+    day = func.date(Transaction.time)
+    return (
+        select(
+            day,
+            Transaction.user_name,
+            PurchaseEntry.product_id,
+            lines,
+            func.sum(case((and_(is_first, not_(is_outlier)), Transaction.amount), else_=0)),
+        )
+        .join(PurchaseEntry, PurchaseEntry.purchase_id == Transaction.purchase_id)
+        .where(*conditions)
+        .group_by(day, Transaction.user_name, PurchaseEntry.product_id)
+        .having(lines > 0)
+    )
+
+
+def credit_lines_query(*conditions: ColumnElement[bool]) -> Select:
+    """
+    Sum the transactions matching `conditions` which are not purchases per
+    day and user, separately for money taken from and added to the box.
+    """
+    taken = Transaction.amount > 0
+    day = func.date(Transaction.time)
+    return (
+        select(
+            day,
+            Transaction.user_name,
+            func.sum(case((taken, 1), else_=0)),
+            func.sum(case((taken, Transaction.amount), else_=0)),
+            func.sum(case((taken, 0), else_=1)),
+            func.sum(case((taken, 0), else_=Transaction.amount)),
+        )
+        .where(
+            Transaction.purchase_id.is_(None),
+            func.abs(Transaction.amount) <= OUTLIER_LIMIT,
+            *conditions,
+        )
+        .group_by(day, Transaction.user_name)
+    )
+
+
+def update_rollups(sql_session: Session, _retry: bool = True) -> None:
+    """
+    Fold the transactions committed since the last update into the daily rollups.
+
+    Transactions committed by concurrent sessions may become visible out of
+    id order, so like `ProductSales`, the transactions more than
+    `TRANSACTION_REORDER_WINDOW` ids below the newest one are folded by id
+    range, and the newer ones are folded by id and remembered, so that one
+    which appears late is still folded exactly once. The watermark and the
+    remembered ids are stored in the `meta` table, and the watermark is
+    locked while updating, so that concurrent updates do not count twice.
+    """
+    watermark = sql_session.get(Meta, WATERMARK_KEY, with_for_update=True)
+    if watermark is None:
+        watermark = Meta(WATERMARK_KEY, "0")
+        sql_session.add(watermark)
+    recent_ids = sql_session.get(Meta, RECENT_KEY)
+    if recent_ids is None:
+        recent_ids = Meta(RECENT_KEY, "")
+        sql_session.add(recent_ids)
+    settled = int(watermark.value)
+    recent = {int(i) for i in recent_ids.value.split(",") if i}
+
+    latest, unsettled = sql_session.execute(
+        select(func.max(Transaction.id), func.count()).where(Transaction.id > settled),
+    ).one()
+
+    if latest is not None and unsettled != len(recent):
+        new_settled = max(settled, latest - TRANSACTION_REORDER_WINDOW)
+        window_ids = set(
+            sql_session.scalars(
+                select(Transaction.id).where(
+                    Transaction.id > new_settled,
+                    Transaction.id <= latest,
+                ),
+            ),
+        )
+        new_transactions = or_(
+            and_(
+                Transaction.id > settled,
+                Transaction.id <= new_settled,
+                Transaction.id.not_in(sorted(recent)),
+            ),
+            Transaction.id.in_(sorted(window_ids - recent)),
+        )
+        purchase_rows = [
+            (as_date(day), *rest)
+            for day, *rest in sql_session.execute(purchase_lines_query(new_transactions))
+        ]
+        credit_rows = [
+            (as_date(day), *rest)
+            for day, *rest in sql_session.execute(credit_lines_query(new_transactions))
+        ]
+
+        if purchase_rows:
+            days = [row[0] for row in purchase_rows]
+            existing = {
+                (rollup.day, rollup.user_name, rollup.product_id): rollup
+                for rollup in sql_session.scalars(
+                    select(PurchaseRollup).where(PurchaseRollup.day.between(min(days), max(days))),
+                )
+            }
+            for day, user_name, product_id, lines, amount in purchase_rows:
+                rollup = existing.get((day, user_name, product_id))
+                if rollup is None:
+                    rollup = PurchaseRollup(day, user_name, product_id)
+                    sql_session.add(rollup)
+                rollup.lines += lines
+                rollup.amount += amount
+
+        if credit_rows:
+            days = [row[0] for row in credit_rows]
+            existing = {
+                (rollup.day, rollup.user_name): rollup
+                for rollup in sql_session.scalars(
+                    select(CreditRollup).where(CreditRollup.day.between(min(days), max(days))),
+                )
+            }
+            for day, user_name, taken_count, taken, added_count, added in credit_rows:
+                rollup = existing.get((day, user_name))
+                if rollup is None:
+                    rollup = CreditRollup(day, user_name)
+                    sql_session.add(rollup)
+                rollup.taken_count += taken_count
+                rollup.taken += taken
+                rollup.added_count += added_count
+                rollup.added += added
+
+        watermark.value = str(new_settled)
+        recent_ids.value = ",".join(str(i) for i in sorted(recent | window_ids) if i > new_settled)
+
+    try:
+        sql_session.commit()
+    except IntegrityError:
+        # Someone else created the first rollups at the same time as us
+        sql_session.rollback()
+        if not _retry:
+            raise
+        update_rollups(sql_session, _retry=False)
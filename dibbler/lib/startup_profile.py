@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import sys
+import time
+from typing import TextIO
+
+__all__ = [
+    "StartupProfile",
+]
+
+
+class StartupProfile:
+    """
+    Wall clock time spent in each phase of starting up, for `--profile-startup`.
+    """
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.phases: list[tuple[str, float]] = []
+
+    def mark(self, phase: str) -> None:
+        """
+        Record that `phase` ended now, and started when the previous one ended.
+        """
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self, file: TextIO = sys.stderr) -> None:
+        width = max((len(phase) for phase, _ in self.phases), default=0)
+        print("Startup profile:", file=file)
+        for phase, seconds in self.phases:
+            print(f"  {phase:<{width}}  {seconds * 1000:8.1f} ms", file=file)
+        print(f"  {'total':<{width}}  {(self.last - self.start) * 1000:8.1f} ms", file=file)
+        print(f"  {len(sys.modules)} modules loaded", file=file)
+        print("Run with python -X importtime for a per module breakdown", file=file)
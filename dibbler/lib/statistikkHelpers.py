@@ -3,12 +3,24 @@
 
 import datetime
 from collections import defaultdict
+from itertools import accumulate, islice
 from pathlib import Path
 
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
-from ..models import Transaction
+from ..models import CreditRollup, Product, PurchaseRollup, Transaction
 from .helpers import *
+from .rollups import update_rollups
+from .transaction_log import DEFAULT_LOG_PATH, LogFormatError, TransactionLog
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Number of rows fetched from the database, and processed, at a time
+ROW_CHUNK_SIZE = 10000
 
 
 def getUser(sql_session: Session) -> str:
@@ -67,26 +79,47 @@ def getProduct(sql_session: Session) -> str:
 
 
 class Database:
-    # for varer
-    varePersonAntall = defaultdict(dict)  # varePersonAntall[Oreo][trygvrad] == 3
-    vareDatoAntall = defaultdict(list)  # dict->array
-    vareUkedagAntall = defaultdict(list)
-    # for personer
-    personVareAntall = defaultdict(dict)  # personVareAntall[trygvrad][Oreo] == 3
-    personVareVerdi = defaultdict(dict)  # personVareVerdi[trygvrad][Oreo] == 30 #[kr]
-    personDatoVerdi = defaultdict(list)  # dict->array
-    personUkedagVerdi = defaultdict(list)
-    # for global
-    personPosTransactions = {}  # personPosTransactions[trygvrad] == 100 #trygvrad har lagt 100kr i boksen
-    personNegTransactions = {}  # personNegTransactions[trygvrad» == 70 #trygvrad har tatt 70kr fra boksen
-    globalVareAntall = {}  # globalVareAntall[Oreo] == 3
-    globalVareVerdi = {}  # globalVareVerdi[Oreo] == 30 #[kr]
-    globalPersonAntall = {}  # globalPersonAntall[trygvrad] == 3
-    globalPersonForbruk = {}  # globalPersonVerdi == 30 #[kr]
-    globalUkedagForbruk = []
-    globalDatoVarer = []
-    globalDatoForbruk = []
-    pengebeholdning = []
+    __slots__ = (
+        "varePersonAntall",
+        "vareDatoAntall",
+        "vareUkedagAntall",
+        "personVareAntall",
+        "personVareVerdi",
+        "personDatoVerdi",
+        "personUkedagVerdi",
+        "personPosTransactions",
+        "personNegTransactions",
+        "globalVareAntall",
+        "globalVareVerdi",
+        "globalPersonAntall",
+        "globalPersonForbruk",
+        "globalUkedagForbruk",
+        "globalDatoVarer",
+        "globalDatoForbruk",
+        "pengebeholdning",
+    )
+
+    def __init__(self) -> None:
+        # for varer
+        self.varePersonAntall = defaultdict(dict)  # varePersonAntall[Oreo][trygvrad] == 3
+        self.vareDatoAntall = defaultdict(list)  # dict->array
+        self.vareUkedagAntall = defaultdict(list)
+        # for personer
+        self.personVareAntall = defaultdict(dict)  # personVareAntall[trygvrad][Oreo] == 3
+        self.personVareVerdi = defaultdict(dict)  # personVareVerdi[trygvrad][Oreo] == 30 #[kr]
+        self.personDatoVerdi = defaultdict(list)  # dict->array
+        self.personUkedagVerdi = defaultdict(list)
+        # for global
+        self.personPosTransactions = {}  # personPosTransactions[trygvrad] == 100 #trygvrad har lagt 100kr i boksen
+        self.personNegTransactions = {}  # personNegTransactions[trygvrad» == 70 #trygvrad har tatt 70kr fra boksen
+        self.globalVareAntall = {}  # globalVareAntall[Oreo] == 3
+        self.globalVareVerdi = {}  # globalVareVerdi[Oreo] == 30 #[kr]
+        self.globalPersonAntall = {}  # globalPersonAntall[trygvrad] == 3
+        self.globalPersonForbruk = {}  # globalPersonVerdi == 30 #[kr]
+        self.globalUkedagForbruk = []
+        self.globalDatoVarer = []
+        self.globalDatoForbruk = []
+        self.pengebeholdning = []
 
 
 class InputLine:
@@ -123,16 +156,6 @@ def getInputType():
     return int(inp)
 
 
-def getProducts(products: str) -> list[tuple[str]]:
-    product = []
-    split_products = products.partition("¤")
-    product.append(products[0])
-    while products[1] == "¤":
-        split_products = split_products[2].partition("¤")
-        product.append(products[0])
-    return product
-
-
 def getDateFile(date: str, inp: str) -> datetime.date:
     try:
         year = inp.partition("-")
@@ -148,52 +171,26 @@ def getDateFile(date: str, inp: str) -> datetime.date:
         )
 
 
-def dateToDateNumFile(date, startDate):
-    year = date.partition("-")
-    month = year[2].partition("-")
-    day = datetime.date(int(year[0]), int(month[0]), int(month[2]))
-    deltaDays = day - startDate
-    return int(deltaDays.days), day.weekday()
-
-
-def clearDatabase(database):
-    database.varePersonAntall.clear()
-    database.vareDatoAntall.clear()
-    database.vareUkedagAntall.clear()
-    database.personVareAntall.clear()
-    database.personVareVerdi.clear()
-    database.personDatoVerdi.clear()
-    database.personUkedagVerdi.clear()
-    database.personPosTransactions.clear()
-    database.personNegTransactions.clear()
-    database.globalVareAntall.clear()
-    database.globalVareVerdi.clear()
-    database.globalPersonAntall.clear()
-    database.globalPersonForbruk.clear()
-    return database
-
-
-def addLineToDatabase(database, inputLine):
-    if abs(inputLine.price) > 90000:
-        return database
+def addLineToDatabase(database, inputLine, count=1):
+    # count > 1 means that inputLine is the sum of that many lines
     # fyller inn for varer
     if (inputLine.product != "") and (
         (inputLine.inputProduct == "") or (inputLine.inputProduct == inputLine.product)
     ):
         database.varePersonAntall[inputLine.product][inputLine.user] = (
-            database.varePersonAntall[inputLine.product].setdefault(inputLine.user, 0) + 1
+            database.varePersonAntall[inputLine.product].setdefault(inputLine.user, 0) + count
         )
         if inputLine.product not in database.vareDatoAntall:
             database.vareDatoAntall[inputLine.product] = [0] * (inputLine.numberOfDays + 1)
-        database.vareDatoAntall[inputLine.product][inputLine.dateNum] += 1
+        database.vareDatoAntall[inputLine.product][inputLine.dateNum] += count
         if inputLine.product not in database.vareUkedagAntall:
             database.vareUkedagAntall[inputLine.product] = [0] * 7
-        database.vareUkedagAntall[inputLine.product][inputLine.weekday] += 1
+        database.vareUkedagAntall[inputLine.product][inputLine.weekday] += count
     # fyller inn for personer
     if (inputLine.inputUser == "") or (inputLine.inputUser == inputLine.user):
         if inputLine.product != "":
             database.personVareAntall[inputLine.user][inputLine.product] = (
-                database.personVareAntall[inputLine.user].setdefault(inputLine.product, 0) + 1
+                database.personVareAntall[inputLine.user].setdefault(inputLine.product, 0) + count
             )
             database.personVareVerdi[inputLine.user][inputLine.product] = (
                 database.personVareVerdi[inputLine.user].setdefault(inputLine.product, 0)
@@ -217,7 +214,7 @@ def addLineToDatabase(database, inputLine):
             )
     elif inputLine.inputType != 1:
         database.globalVareAntall[inputLine.product] = (
-            database.globalVareAntall.setdefault(inputLine.product, 0) + 1
+            database.globalVareAntall.setdefault(inputLine.product, 0) + count
         )
         database.globalVareVerdi[inputLine.product] = (
             database.globalVareVerdi.setdefault(inputLine.product, 0) + inputLine.price
@@ -228,29 +225,236 @@ def addLineToDatabase(database, inputLine):
         database.pengebeholdning[inputLine.dateNum] += inputLine.price
         if inputLine.product != "":
             database.globalPersonAntall[inputLine.user] = (
-                database.globalPersonAntall.setdefault(inputLine.user, 0) + 1
+                database.globalPersonAntall.setdefault(inputLine.user, 0) + count
             )
             database.globalPersonForbruk[inputLine.user] = (
                 database.globalPersonForbruk.setdefault(inputLine.user, 0) + inputLine.price
             )
-            database.globalDatoVarer[inputLine.dateNum] += 1
+            database.globalDatoVarer[inputLine.dateNum] += count
             database.globalDatoForbruk[inputLine.dateNum] += inputLine.price
             database.globalUkedagForbruk[inputLine.weekday] += inputLine.price
     return database
 
 
-def buildDatabaseFromDb(inputType, inputProduct, inputUser, sql_session: Session):
+def fillDatabaseFromRows(database, inputLine, startDate, purchaseRows, creditRows):
+    """
+    Fill the database from the rows of purchaseLinesQuery and creditLinesQuery,
+    with the day replaced by the number of days since startDate.
+    """
+    for dateNum, user, product, lines, price in purchaseRows:
+        inputLine.dateNum, inputLine.weekday = dateNum, (startDate.weekday() + dateNum) % 7
+        inputLine.user = user
+        inputLine.product = product
+        inputLine.price = price
+        database = addLineToDatabase(database, inputLine, lines)
+    inputLine.product = ""
+    for dateNum, user, nTaken, taken, nAdded, added in creditRows:
+        inputLine.dateNum, inputLine.weekday = dateNum, (startDate.weekday() + dateNum) % 7
+        inputLine.user = user
+        for lines, price in ((nTaken, taken), (nAdded, added)):
+            if lines > 0:
+                inputLine.price = price
+                database = addLineToDatabase(database, inputLine, lines)
+    return database
+
+
+def chunked(rows, size=ROW_CHUNK_SIZE):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def fillDatabaseColumnar(database, inputLine, startDate, purchaseRows, creditRows):
+    """
+    Same as fillDatabaseFromRows, but loads the rows into NumPy arrays one
+    chunk at a time and computes each series as a histogram with bincount.
+    """
+    numberOfDays = inputLine.numberOfDays + 1
+    globalStats = (inputLine.inputType == 3) or (inputLine.inputType == 4)
+
+    def columns(rows, types):
+        return [
+            np.array(column, dtype=t)
+            for column, t in zip(zip(*rows, strict=True), types, strict=True)
+        ]
+
+    def histogram(codes, weights, length, mask=None):
+        if mask is not None:
+            codes, weights = codes[mask], weights[mask]
+        return np.bincount(codes, weights=weights, minlength=length).astype(np.int64)
+
+    def grid(rowCodes, nRows, colCodes, nCols, weights, mask=None):
+        return histogram(rowCodes * nCols + colCodes, weights, nRows * nCols, mask).reshape(
+            nRows,
+            nCols,
+        )
+
+    def addTo(dictionary, key, value):
+        dictionary[key] = dictionary.get(key, 0) + value
+
+    # Per-day series are summed as arrays, and converted to lists at the end
+    vareDatoAntall = {}
+    vareUkedagAntall = {}
+    personDatoVerdi = {}
+    personUkedagVerdi = {}
+    globalDatoVarer = np.zeros(numberOfDays, dtype=np.int64)
+    globalDatoForbruk = np.zeros(numberOfDays, dtype=np.int64)
+    globalUkedagForbruk = np.zeros(7, dtype=np.int64)
+    pengebeholdning = np.zeros(numberOfDays, dtype=np.int64)
+
+    # fyller inn for varer og personer
+    for chunk in chunked(purchaseRows):
+        dateNum, users, products, lines, price = columns(
+            chunk,
+            (np.int64, str, str, np.int64, np.int64),
+        )
+        weekday = (dateNum + startDate.weekday()) % 7
+        userKeys, userCodes = np.unique(users, return_inverse=True)
+        productKeys, productCodes = np.unique(products, return_inverse=True)
+        nUsers, nProducts = len(userKeys), len(productKeys)
+        ones = np.ones(len(lines), dtype=np.int64)
+
+        vareMask = (inputLine.inputProduct == "") | (products == inputLine.inputProduct)
+        vareSeen = grid(productCodes, nProducts, userCodes, nUsers, ones, vareMask) > 0
+        varePerson = grid(productCodes, nProducts, userCodes, nUsers, lines, vareMask)
+        vareDato = grid(productCodes, nProducts, dateNum, numberOfDays, lines, vareMask)
+        vareUkedag = grid(productCodes, nProducts, weekday, 7, lines, vareMask)
+        for p in np.flatnonzero(vareSeen.any(axis=1)):
+            product = str(productKeys[p])
+            personAntall = database.varePersonAntall[product]
+            for u in np.flatnonzero(vareSeen[p]):
+                addTo(personAntall, str(userKeys[u]), int(varePerson[p, u]))
+            addTo(vareDatoAntall, product, vareDato[p])
+            addTo(vareUkedagAntall, product, vareUkedag[p])
+
+        personMask = (inputLine.inputUser == "") | (users == inputLine.inputUser)
+        personSeen = grid(userCodes, nUsers, productCodes, nProducts, ones, personMask) > 0
+        personVare = grid(userCodes, nUsers, productCodes, nProducts, lines, personMask)
+        personVerdi = grid(userCodes, nUsers, productCodes, nProducts, price, personMask)
+        personDato = grid(userCodes, nUsers, dateNum, numberOfDays, price, personMask)
+        personUkedag = grid(userCodes, nUsers, weekday, 7, price, personMask)
+        for u in np.flatnonzero(personSeen.any(axis=1)):
+            user = str(userKeys[u])
+            vareAntall = database.personVareAntall[user]
+            vareVerdi = database.personVareVerdi[user]
+            for p in np.flatnonzero(personSeen[u]):
+                addTo(vareAntall, str(productKeys[p]), int(personVare[u, p]))
+                addTo(vareVerdi, str(productKeys[p]), int(personVerdi[u, p]))
+            addTo(personDatoVerdi, user, personDato[u])
+            addTo(personUkedagVerdi, user, personUkedag[u])
+
+        if inputLine.inputType != 1:
+            vareAntall = histogram(productCodes, lines, nProducts)
+            vareVerdi = histogram(productCodes, price, nProducts)
+            for p, product in enumerate(productKeys):
+                addTo(database.globalVareAntall, str(product), int(vareAntall[p]))
+                addTo(database.globalVareVerdi, str(product), int(vareVerdi[p]))
+
+        if globalStats:
+            personAntall = histogram(userCodes, lines, nUsers)
+            personForbruk = histogram(userCodes, price, nUsers)
+            for u, user in enumerate(userKeys):
+                addTo(database.globalPersonAntall, str(user), int(personAntall[u]))
+                addTo(database.globalPersonForbruk, str(user), int(personForbruk[u]))
+            globalDatoVarer += histogram(dateNum, lines, numberOfDays)
+            globalDatoForbruk += histogram(dateNum, price, numberOfDays)
+            globalUkedagForbruk += histogram(weekday, price, 7)
+            pengebeholdning += histogram(dateNum, price, numberOfDays)
+
+    for series, target in (
+        (vareDatoAntall, database.vareDatoAntall),
+        (vareUkedagAntall, database.vareUkedagAntall),
+        (personDatoVerdi, database.personDatoVerdi),
+        (personUkedagVerdi, database.personUkedagVerdi),
+    ):
+        for key, values in series.items():
+            target[key] = values.tolist()
+
+    # fyller inn delt statistikk
+    for chunk in chunked(creditRows):
+        dateNum, users, nTaken, taken, nAdded, added = columns(
+            chunk,
+            (np.int64, str, np.int64, np.int64, np.int64, np.int64),
+        )
+        userKeys, userCodes = np.unique(users, return_inverse=True)
+        nUsers = len(userKeys)
+        for counts, amounts, target in (
+            (nTaken, taken, database.personPosTransactions),
+            (nAdded, added, database.personNegTransactions),
+        ):
+            seen = histogram(userCodes, counts, nUsers) > 0
+            sums = histogram(userCodes, amounts, nUsers)
+            for u in np.flatnonzero(seen):
+                addTo(target, str(userKeys[u]), int(sums[u]))
+        if globalStats:
+            pengebeholdning += histogram(dateNum, taken + added, numberOfDays)
+
+    if globalStats:
+        database.globalDatoVarer = globalDatoVarer.tolist()
+        database.globalDatoForbruk = globalDatoForbruk.tolist()
+        database.globalUkedagForbruk = globalUkedagForbruk.tolist()
+        database.pengebeholdning = pengebeholdning.tolist()
+    return database
+
+
+def purchaseLinesQuery(startDate, endDate):
+    """
+    Sum the purchase rollups from startDate up to endDate per day, user and product.
+    """
+    lines = func.sum(PurchaseRollup.lines)
+    return (
+        select(
+            PurchaseRollup.day,
+            PurchaseRollup.user_name,
+            Product.name,
+            lines,
+            func.sum(PurchaseRollup.amount),
+        )
+        .join(Product, Product.product_id == PurchaseRollup.product_id)
+        .where(PurchaseRollup.day >= startDate, PurchaseRollup.day < endDate)
+        .group_by(PurchaseRollup.day, PurchaseRollup.user_name, Product.name)
+    )
+
+
+def creditLinesQuery(startDate, endDate):
+    """
+    Get the credit rollups from startDate up to endDate.
+    """
+    return select(
+        CreditRollup.day,
+        CreditRollup.user_name,
+        CreditRollup.taken_count,
+        CreditRollup.taken,
+        CreditRollup.added_count,
+        CreditRollup.added,
+    ).where(CreditRollup.day >= startDate, CreditRollup.day < endDate)
+
+
+def buildDatabaseFromDb(
+    inputType,
+    inputProduct,
+    inputUser,
+    sql_session: Session,
+    sdate: str | None = None,
+    edate: str | None = None,
+    logPath: Path = DEFAULT_LOG_PATH,
+):
     assert sql_session is not None
-    sdate = input("enter start date (yyyy-mm-dd)? ")
-    edate = input("enter end date (yyyy-mm-dd)? ")
+    if sdate is None:
+        sdate = input("enter start date (yyyy-mm-dd)? ")
+    if edate is None:
+        edate = input("enter end date (yyyy-mm-dd)? ")
     print("building database...")
-    transaction_list = sql_session.query(Transaction).all()
+    update_rollups(sql_session)
+    firstTime, lastTime = sql_session.execute(
+        select(func.min(Transaction.time), func.max(Transaction.time)),
+    ).one()
     inputLine = InputLine(inputUser, inputProduct, inputType)
-    startDate = getDateDb(transaction_list[0].time, sdate)
-    endDate = getDateDb(transaction_list[-1].time, edate)
+    # Count whole days, starting at midnight
+    startDate = datetime.datetime.combine(getDateDb(firstTime, sdate).date(), datetime.time())
+    endDate = datetime.datetime.combine(getDateDb(lastTime, edate).date(), datetime.time())
     inputLine.numberOfDays = (endDate - startDate).days
     database = Database()
-    database = clearDatabase(database)
 
     if (inputType == 3) or (inputType == 4):
         database.globalDatoVarer = [0] * (inputLine.numberOfDays + 1)
@@ -258,45 +462,31 @@ def buildDatabaseFromDb(inputType, inputProduct, inputUser, sql_session: Session
         database.globalUkedagForbruk = [0] * 7
         database.pengebeholdning = [0] * (inputLine.numberOfDays + 1)
     print("wait for it.... ")
-    for transaction in transaction_list:
-        if transaction.purchase:
-            products = [ent.product.name for ent in transaction.purchase.entries]
-        else:
-            products = []
-            products.append("")
-        inputLine.dateNum, inputLine.weekday = dateToDateNumDb(transaction.time, startDate)
-        if inputLine.dateNum < 0 or inputLine.dateNum > (inputLine.numberOfDays):
-            continue
-        inputLine.user = transaction.user.name
-        inputLine.price = transaction.amount
-        for inputLine.product in products:
-            database = addLineToDatabase(database, inputLine)
-            inputLine.price = 0
-
-    print("saving as default.dibblerlog...", end=" ")
-    f = Path.open("default.dibblerlog", "w")
-    line_format = "%s|%s|%s|%s|%s|%s\n"
-    transaction_list = sql_session.query(Transaction).all()
-    for transaction in transaction_list:
-        if transaction.purchase:
-            products = "¤".join([ent.product.name for ent in transaction.purchase.entries])
-        else:
-            products = ""
-        line = line_format % (
-            "purchase",
-            transaction.time,
-            products,
-            transaction.user.name,
-            transaction.amount,
-            transaction.description,
-        )
-        f.write(line.encode("utf8"))
-    f.close()
+    dayAfterEnd = (endDate + datetime.timedelta(days=1)).date()
+    # The rows are streamed, so that only one chunk is kept in memory at a time.
+    # Each query is only run when its rows are first asked for, so the purchase
+    # rows are consumed before the credit rows are queried.
+
+    def streamRows(query):
+        for day, *columns in sql_session.execute(
+            query.execution_options(yield_per=ROW_CHUNK_SIZE),
+        ):
+            yield ((day - startDate.date()).days, *columns)
+
+    purchaseRows = streamRows(purchaseLinesQuery(startDate.date(), dayAfterEnd))
+    creditRows = streamRows(creditLinesQuery(startDate.date(), dayAfterEnd))
+    if np is not None:
+        database = fillDatabaseColumnar(database, inputLine, startDate, purchaseRows, creditRows)
+    else:
+        database = fillDatabaseFromRows(database, inputLine, startDate, purchaseRows, creditRows)
+    print(f"saving as {logPath}...", end=" ")
+    TransactionLog(logPath).export(sql_session)
     # bygg database.pengebeholdning
     if (inputType == 3) or (inputType == 4):
-        for i in range(inputLine.numberOfDays + 1):
-            if i > 0:
-                database.pengebeholdning[i] += database.pengebeholdning[i - 1]
+        if np is not None:
+            database.pengebeholdning = np.cumsum(database.pengebeholdning).tolist()
+        else:
+            database.pengebeholdning = list(accumulate(database.pengebeholdning))
     # bygg dateLine
     day = datetime.timedelta(days=1)
     dateLine = []
@@ -308,48 +498,33 @@ def buildDatabaseFromDb(inputType, inputProduct, inputUser, sql_session: Session
 
 
 def buildDatabaseFromFile(inputFile, inputType, inputProduct, inputUser):
+    log = TransactionLog(Path(inputFile))
+    firstTime, lastTime = log.time_range() or (datetime.datetime.now(),) * 2
     sdate = input("enter start date (yyyy-mm-dd)? ")
     edate = input("enter end date (yyyy-mm-dd)? ")
 
-    f = Path.open(inputFile)
-    try:
-        fileLines = f.readlines()
-    finally:
-        f.close()
     inputLine = InputLine(inputUser, inputProduct, inputType)
-    startDate = getDateFile(fileLines[0].partition("|")[2].partition(" ")[0], sdate)
-    endDate = getDateFile(fileLines[-1].partition("|")[2].partition(" ")[0], edate)
+    startDate = getDateFile(firstTime.date().isoformat(), sdate)
+    endDate = getDateFile(lastTime.date().isoformat(), edate)
     inputLine.numberOfDays = (endDate - startDate).days
     database = Database()
-    database = clearDatabase(database)
 
     if (inputType == 3) or (inputType == 4):
         database.globalDatoVarer = [0] * (inputLine.numberOfDays + 1)
         database.globalDatoForbruk = [0] * (inputLine.numberOfDays + 1)
         database.globalUkedagForbruk = [0] * 7
         database.pengebeholdning = [0] * (inputLine.numberOfDays + 1)
-    for linje in fileLines:
-        if linje[0] != "#" and linje != "\n":
-            # henter dateNum, products, user, price
-            restDel = linje.partition("|")
-            restDel = restDel[2].partition(" ")
-            inputLine.dateNum, inputLine.weekday = dateToDateNumFile(restDel[0], startDate)
-            if inputLine.dateNum < 0 or inputLine.dateNum > (inputLine.numberOfDays):
-                continue
-            restDel = restDel[2].partition("|")
-            restDel = restDel[2].partition("|")
-            products = restDel[0]
-            restDel = restDel[2].partition("|")
-            inputLine.user = restDel[0]
-            inputLine.price = int(restDel[2].partition("|")[0])
-            for inputLine.product in getProducts(products):
-                database = addLineToDatabase(database, inputLine)
-                inputLine.price = 0
+    purchaseRows, creditRows = log.rows(startDate, inputLine.numberOfDays)
+    if np is not None:
+        database = fillDatabaseColumnar(database, inputLine, startDate, purchaseRows, creditRows)
+    else:
+        database = fillDatabaseFromRows(database, inputLine, startDate, purchaseRows, creditRows)
     # bygg database.pengebeholdning
     if (inputType == 3) or (inputType == 4):
-        for i in range(inputLine.numberOfDays + 1):
-            if i > 0:
-                database.pengebeholdning[i] += database.pengebeholdning[i - 1]
+        if np is not None:
+            database.pengebeholdning = np.cumsum(database.pengebeholdning).tolist()
+        else:
+            database.pengebeholdning = list(accumulate(database.pengebeholdning))
     # bygg dateLine
     day = datetime.timedelta(days=1)
     dateLine = []
@@ -505,6 +680,15 @@ def statisticsTextOnly(sql_session: Session) -> None:
     if inp == "1":
         database, dateLine = buildDatabaseFromDb(inputType, product, user, sql_session)
     elif inp == "0" or inp == "":
-        database, dateLine = buildDatabaseFromFile("default.dibblerlog", inputType, product, user)
+        try:
+            database, dateLine = buildDatabaseFromFile(
+                DEFAULT_LOG_PATH,
+                inputType,
+                product,
+                user,
+            )
+        except LogFormatError as e:
+            print(f"{e}, build the statistics from the database to replace it")
+            return
     if inp != "q":
         alt4menuTextOnly(database, dateLine, sql_session)
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from sqlalchemy import case, func, select
+
+from ..models import Product, User
+
+if TYPE_CHECKING:
+    from sqlalchemy import Result, Row
+    from sqlalchemy.orm import Session
+
+__all__ = [
+    "balance_summary",
+    "product_listing",
+]
+
+
+def balance_summary(sql_session: Session) -> Row:
+    """
+    The value of the products in stock, and the sums of the positive and the
+    negative credits, as a row of `(total_value, positive_credit,
+    negative_credit)`, in one query.
+    """
+    total_value = (
+        select(func.coalesce(func.sum(Product.stock * Product.price), 0))
+        .where(Product.stock > 0)
+        .scalar_subquery()
+    )
+    credit_sums = select(
+        func.coalesce(func.sum(case((User.credit > 0, User.credit), else_=0)), 0).label(
+            "positive_credit",
+        ),
+        func.coalesce(func.sum(case((User.credit < 0, User.credit), else_=0)), 0).label(
+            "negative_credit",
+        ),
+    ).subquery()
+    return sql_session.execute(
+        select(
+            total_value.label("total_value"),
+            credit_sums.c.positive_credit,
+            credit_sums.c.negative_credit,
+        ),
+    ).one()
+
+
+def product_listing(sql_session: Session, yield_per: int | None = None) -> Result:
+    """
+    The products which are not hidden, with the most in stock first, as rows
+    of `(product, total_value)`, in one query. `total_value` is the value of
+    the stock of all the listed products, and is the same on every row.
+
+    If `yield_per` is given, the rows are fetched that many at a time.
+    """
+    total_value = func.sum(Product.price * Product.stock).over()
+    query = (
+        select(Product, total_value.label("total_value"))
+        .where(Product.hidden.is_(False))
+        .order_by(Product.stock.desc())
+    )
+    if yield_per is not None:
+        query = query.execution_options(yield_per=yield_per)
+    return sql_session.execute(query)
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import itertools
+import math
+import random
+import string
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy import func, insert, select, update
+
+from ..models import Product, Purchase, PurchaseEntry, Transaction, User, UserProducts
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+
+__all__ = [
+    "generate",
+]
+
+# Rows are inserted in batches of this size, to keep memory use bounded
+BATCH_SIZE = 10000
+
+PRODUCT_WORDS = (
+    ("Cola", "Pepsi", "Solo", "Urge", "Fanta", "Sprite", "Monster", "Red Bull", "Burn", "Battery"),
+    ("Zero", "Max", "Original", "Lime", "Mango", "Cherry", "Vanilla", "Light", "Ultra", "Classic"),
+    ("0.33l", "0.5l", "1.5l", "boks", "flaske", "stk", "pk", "mini", "XL", ""),
+)
+
+
+def zipf_weights(n: int, s: float) -> list[float]:
+    """
+    Cumulative weights where the i-th most popular choice is picked
+    proportionally to 1 / i**s.
+    """
+    return list(itertools.accumulate(1 / (rank**s) for rank in range(1, n + 1)))
+
+
+def unique_name(rng: random.Random, taken: set[str]) -> str:
+    while True:
+        name = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 8)))
+        if name not in taken:
+            taken.add(name)
+            return name
+
+
+def generate(
+    sql_session: Session,
+    users: int = 100,
+    products: int = 300,
+    days: int = 365,
+    purchases_per_day: int = 40,
+    skew: float = 1.1,
+    seed: int = 0,
+    end: datetime | None = None,
+) -> None:
+    """
+    Fill the database with `users` users, `products` products and `days` days
+    of purchases, deposits and transfers up to `end`, or now.
+
+    How often a user buys, and how often a product is bought, follows a Zipf
+    distribution with exponent `skew`, so that a few users and products
+    account for most of the purchases, like on a real kiosk. Credits and the
+    per-user product counters agree with the generated transactions. The same
+    arguments always give the same data.
+    """
+    rng = random.Random(seed)
+    if end is None:
+        end = datetime.now().replace(microsecond=0)
+    start = end - timedelta(days=days)
+
+    next_purchase_id = (sql_session.scalar(select(func.max(Purchase.id))) or 0) + 1
+    next_entry_id = (sql_session.scalar(select(func.max(PurchaseEntry.id))) or 0) + 1
+    next_product_id = (sql_session.scalar(select(func.max(Product.product_id))) or 0) + 1
+
+    taken_names = set(sql_session.scalars(select(User.name)))
+    user_rows = [
+        {
+            "name": unique_name(rng, taken_names),
+            "credit": 0,
+            "card": f"{rng.randrange(10**7, 10**8)}",
+            "rfid": f"{rng.getrandbits(32):08x}",
+        }
+        for _ in range(users)
+    ]
+
+    taken_product_names: set[str] = set()
+    product_rows = []
+    for i in range(products):
+        name = " ".join(word for word in (rng.choice(words) for words in PRODUCT_WORDS) if word)
+        if name in taken_product_names:
+            name = f"{name} {i}"
+        taken_product_names.add(name)
+        product_rows.append(
+            {
+                "product_id": next_product_id + i,
+                "bar_code": f"{7000000000000 + (next_product_id + i) * 7919}",
+                "name": name,
+                "price": rng.randint(5, 60),
+                "stock": rng.randint(0, 100),
+                "hidden": False,
+            },
+        )
+
+    # Shuffled, so that popularity does not follow the order of creation
+    popular_users = rng.sample(user_rows, len(user_rows))
+    popular_products = rng.sample(product_rows, len(product_rows))
+    user_weights = zipf_weights(len(popular_users), skew)
+    product_weights = zipf_weights(len(popular_products), skew)
+
+    credit_changes = {row["name"]: 0 for row in user_rows}
+    counters: dict[tuple[str, int], int] = {}
+    purchases: list[dict[str, Any]] = []
+    entries: list[dict[str, Any]] = []
+    transactions: list[dict[str, Any]] = []
+
+    def flush() -> None:
+        for model, rows in (
+            (Purchase, purchases),
+            (PurchaseEntry, entries),
+            (Transaction, transactions),
+        ):
+            if rows:
+                sql_session.execute(insert(model), rows)
+                rows.clear()
+
+    def transaction(user: str, amount: int, time: datetime, **kwargs: int | str) -> None:
+        credit_changes[user] -= amount
+        transactions.append(
+            {
+                "time": time,
+                "amount": amount,
+                "penalty": 1,
+                "user_name": user,
+                "purchase_id": None,
+                "description": None,
+                **kwargs,
+            },
+        )
+
+    sql_session.execute(insert(User), user_rows)
+    sql_session.execute(insert(Product), product_rows)
+
+    def random_time(midnight: datetime) -> datetime:
+        return midnight + timedelta(seconds=rng.randint(8 * 3600, 24 * 3600 - 1))
+
+    def purchase(time: datetime) -> None:
+        nonlocal next_purchase_id, next_entry_id
+        buyers = {
+            row["name"]
+            for row in rng.choices(
+                popular_users,
+                cum_weights=user_weights,
+                k=rng.choice((1,) * 9 + (2,)),
+            )
+        }
+        bought = {
+            row["product_id"]: row
+            for row in rng.choices(
+                popular_products,
+                cum_weights=product_weights,
+                k=rng.choice((1, 1, 1, 2, 3)),
+            )
+        }
+        price = 0
+        for product in bought.values():
+            amount = rng.choice((1,) * 9 + (2,))
+            price += amount * product["price"]
+            entries.append(
+                {
+                    "id": next_entry_id,
+                    "amount": amount,
+                    "product_id": product["product_id"],
+                    "purchase_id": next_purchase_id,
+                },
+            )
+            next_entry_id += 1
+            for user in buyers:
+                key = (user, product["product_id"])
+                counters[key] = counters.get(key, 0) + amount
+        purchases.append({"id": next_purchase_id, "time": time, "price": price})
+        for user in buyers:
+            transaction(user, math.ceil(price / len(buyers)), time, purchase_id=next_purchase_id)
+        next_purchase_id += 1
+
+    def deposit(time: datetime) -> None:
+        user = rng.choices(popular_users, cum_weights=user_weights)[0]["name"]
+        amount = rng.choice((50, 100, 200, 500))
+        if rng.random() < 0.2:
+            other = rng.choice(user_rows)["name"]
+            transaction(user, amount, time, description=f"transfer to {other}")
+            transaction(other, -amount, time, description=f"transfer from {user}")
+        else:
+            transaction(user, -amount, time, description="manually adjusted credit")
+
+    for day in range(days):
+        midnight = start + timedelta(days=day)
+        # Fewer purchases in the weekend
+        mean = purchases_per_day * (0.6 if midnight.weekday() >= 5 else 1.0)
+        events = [
+            (random_time(midnight), purchase)
+            for _ in range(max(0, round(rng.gauss(mean, math.sqrt(mean)))))
+        ]
+        events += [
+            (random_time(midnight), deposit)
+            for _ in range(rng.randint(0, max(1, purchases_per_day // 10)))
+        ]
+        for time, event in sorted(events, key=lambda event: event[0]):
+            event(time)
+
+        if len(transactions) >= BATCH_SIZE:
+            flush()
+    flush()
+
+    sql_session.execute(
+        update(User),
+        [{"name": name, "credit": credit} for name, credit in credit_changes.items()],
+    )
+    counter_rows = [
+        {
+            "user_name": user,
+            "product_id": product_id,
+            "count": count,
+            "sign": (count > 0) - (count < 0),
+        }
+        for (user, product_id), count in counters.items()
+    ]
+    for i in range(0, len(counter_rows), BATCH_SIZE):
+        sql_session.execute(insert(UserProducts), counter_rows[i : i + BATCH_SIZE])
+    sql_session.commit()
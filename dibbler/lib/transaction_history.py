@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import joinedload, lazyload
+
+from ..models import Purchase, Transaction
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from sqlalchemy.orm import Session
+
+    from ..models import User
+
+__all__ = [
+    "TransactionHistory",
+]
+
+DEFAULT_PAGE_SIZE = 100
+
+
+class TransactionHistory:
+    """
+    A user's transactions, newest first, fetched one page at a time.
+
+    Pages are found with keyset pagination on `(time, id)`, so fetching
+    a page late in the history costs the same as fetching the first one.
+    The purchase entries and products of a page are loaded in one batch.
+    """
+
+    def __init__(
+        self,
+        sql_session: Session,
+        user: User,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> None:
+        self.sql_session = sql_session
+        self.user = user
+        self.page_size = page_size
+
+    def count(self) -> int:
+        return self.sql_session.scalar(
+            select(func.count())
+            .select_from(Transaction)
+            .where(Transaction.user_name == self.user.name),
+        )
+
+    def page(self, after: Transaction | None = None, limit: int | None = None) -> list[Transaction]:
+        """
+        Fetch up to `limit` transactions older than `after`, or the newest ones
+        if `after` is not given.
+        """
+        query = (
+            select(Transaction)
+            .where(Transaction.user_name == self.user.name)
+            .order_by(Transaction.time.desc(), Transaction.id.desc())
+            .limit(limit if limit is not None else self.page_size)
+            .options(
+                # The user is already known, and is in the identity map
+                lazyload(Transaction.user),
+                joinedload(Transaction.purchase).selectinload(Purchase.entries),
+            )
+        )
+        if after is not None:
+            query = query.where(
+                or_(
+                    Transaction.time < after.time,
+                    and_(Transaction.time == after.time, Transaction.id < after.id),
+                ),
+            )
+        return list(self.sql_session.scalars(query).unique())
+
+    def pages(self, limit: int | None = None) -> Iterator[list[Transaction]]:
+        """
+        Iterate over pages of at most `page_size` transactions, newest first,
+        stopping after `limit` transactions in total if given.
+
+        Each page is only fetched when the previous one has been consumed.
+        """
+        remaining = limit
+        last = None
+        while remaining is None or remaining > 0:
+            page_limit = self.page_size if remaining is None else min(self.page_size, remaining)
+            page = self.page(after=last, limit=page_limit)
+            if not page:
+                return
+            yield page
+            if len(page) < page_limit:
+                return
+            last = page[-1]
+            if remaining is not None:
+                remaining -= len(page)
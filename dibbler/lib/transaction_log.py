@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import mmap
+import struct
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO
+
+from sqlalchemy import select
+
+from ..models import Product, PurchaseEntry, Transaction
+from .rollups import OUTLIER_LIMIT, TRANSACTION_REORDER_WINDOW
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+
+__all__ = [
+    "DEFAULT_LOG_PATH",
+    "LogFormatError",
+    "TransactionLog",
+]
+
+DEFAULT_LOG_PATH = Path("default.dibblerlog")
+
+MAGIC = b"DIBBLOG\x01"
+
+# transaction id, seconds since the epoch, user, product (-1 for none), amount
+RECORD = struct.Struct("<qqiiq")
+
+if np is not None:
+    RECORD_DTYPE = np.dtype(
+        [
+            ("id", "<i8"),
+            ("time", "<i8"),
+            ("user", "<i4"),
+            ("product", "<i4"),
+            ("amount", "<i8"),
+        ],
+    )
+    assert RECORD_DTYPE.itemsize == RECORD.size
+
+EPOCH = datetime(1970, 1, 1)
+SECONDS_PER_DAY = 24 * 60 * 60
+
+EXPORT_CHUNK_SIZE = 10000
+
+# Records read at a time when reading the log backwards
+SCAN_CHUNK_SIZE = 4096
+
+
+def to_timestamp(time: datetime) -> int:
+    # Transaction times are naive, so they are stored as if they were UTC
+    return (time - EPOCH) // timedelta(seconds=1)
+
+
+def from_timestamp(timestamp: int) -> datetime:
+    return EPOCH + timedelta(seconds=timestamp)
+
+
+class LogFormatError(ValueError):
+    pass
+
+
+class TransactionLog:
+    """
+    Append-only binary export of the transaction history.
+
+    The log is a short header followed by fixed-width records, one for each
+    product of a purchase, and one for each transaction which is not a
+    purchase. The amount of a purchase is stored on its first record, and
+    the rest have an amount of 0. User and product names are stored once,
+    in a sidecar file with one string per line, and referred to by line
+    number from the records.
+
+    The highest transaction id in the log is the export watermark, so
+    `export` only appends the transactions added since the previous export.
+    Transactions committed by concurrent sessions may become visible out of
+    id order, so the last `TRANSACTION_REORDER_WINDOW` ids below the
+    watermark are looked at again, and the ones which are not in the log
+    yet are added.
+    """
+
+    def __init__(self, path: Path = DEFAULT_LOG_PATH) -> None:
+        self.path = path
+        self.strings_path = path.with_name(path.name + ".strings")
+
+    def _read_strings(self) -> list[str]:
+        if not self.strings_path.exists():
+            return []
+        with self.strings_path.open(encoding="utf-8", newline="\n") as f:
+            return [line.removesuffix("\n") for line in f]
+
+    def _record_count(self) -> int:
+        """
+        Check the header of the log, and return the number of complete records.
+
+        A record cut short by an interrupted export is not counted. A file in
+        any other format, like the old text format, raises LogFormatError.
+        """
+        with self.path.open("rb") as f:
+            header = f.read(len(MAGIC))
+            size = f.seek(0, 2)
+        if size == 0:
+            return 0
+        if header != MAGIC:
+            msg = f"{self.path} is not a binary transaction log"
+            raise LogFormatError(msg)
+        return (size - len(MAGIC)) // RECORD.size
+
+    def _record(self, f: BinaryIO, n: int) -> tuple[int, int, int, int, int]:
+        f.seek(len(MAGIC) + n * RECORD.size)
+        return RECORD.unpack(f.read(RECORD.size))
+
+    def _prepare_append(self) -> int:
+        """
+        Get the log ready to be appended to, and return the number of records.
+
+        A missing or empty log is created, and a record cut short by an
+        interrupted export is dropped. A file in another format is kept,
+        renamed to end in `.old`, and a new log is started.
+        """
+        try:
+            count = self._record_count()
+        except FileNotFoundError:
+            count = 0
+        except LogFormatError:
+            old_path = self.path.with_name(self.path.name + ".old")
+            if old_path.exists():
+                raise
+            self.path.rename(old_path)
+            if self.strings_path.exists():
+                self.strings_path.rename(old_path.with_name(old_path.name + ".strings"))
+            count = 0
+
+        if count == 0:
+            with self.path.open("wb") as f:
+                f.write(MAGIC)
+            self.strings_path.unlink(missing_ok=True)
+        else:
+            with self.path.open("r+b") as f:
+                f.truncate(len(MAGIC) + count * RECORD.size)
+        return count
+
+    def _tail(self, count: int) -> list[tuple[int, int, int, int, int]]:
+        """
+        The records at the end of the log, including all those within
+        `TRANSACTION_REORDER_WINDOW` of the highest transaction id.
+
+        Every export writes its records in id order, starting at most
+        `TRANSACTION_REORDER_WINDOW` below the highest id before it. So when
+        reading backwards, once a record `2 * TRANSACTION_REORDER_WINDOW`
+        below the highest id seen is found, the records before it are all
+        below the window.
+        """
+        highest = 0
+        tail = []
+        with self.path.open("rb") as f:
+            end = count
+            while end > 0:
+                start = max(0, end - SCAN_CHUNK_SIZE)
+                f.seek(len(MAGIC) + start * RECORD.size)
+                chunk = list(RECORD.iter_unpack(f.read((end - start) * RECORD.size)))
+                for record in reversed(chunk):
+                    if record[0] <= highest - 2 * TRANSACTION_REORDER_WINDOW:
+                        return tail
+                    highest = max(highest, record[0])
+                    tail.append(record)
+                end = start
+        return tail
+
+    def time_range(self) -> tuple[datetime, datetime] | None:
+        """
+        The times of the first and the last record, or None if the log is empty.
+        """
+        count = self._record_count()
+        if count == 0:
+            return None
+        with self.path.open("rb") as f:
+            first = self._record(f, 0)[1]
+        # Records added late are appended after newer ones
+        last = max(self._tail(count))[1]
+        return from_timestamp(first), from_timestamp(last)
+
+    def export(self, sql_session: Session) -> int:
+        """
+        Append the transactions added since the last export, and return the
+        number of records written.
+        """
+        tail = self._tail(self._prepare_append())
+        last_id = max((record[0] for record in tail), default=0)
+        logged_ids = {
+            record[0] for record in tail if record[0] > last_id - TRANSACTION_REORDER_WINDOW
+        }
+        strings = self._read_strings()
+        string_ids = {string: i for i, string in enumerate(strings)}
+        new_strings = []
+
+        def intern(string: str) -> int:
+            string_id = string_ids.get(string)
+            if string_id is None:
+                string_id = string_ids[string] = len(strings) + len(new_strings)
+                new_strings.append(string)
+            return string_id
+
+        query = (
+            select(
+                Transaction.id,
+                Transaction.time,
+                Transaction.user_name,
+                Transaction.amount,
+                Product.name,
+            )
+            .outerjoin(PurchaseEntry, PurchaseEntry.purchase_id == Transaction.purchase_id)
+            .outerjoin(Product, Product.product_id == PurchaseEntry.product_id)
+            .where(Transaction.id > last_id - TRANSACTION_REORDER_WINDOW)
+            .order_by(Transaction.id, PurchaseEntry.id)
+            .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+        )
+        records = bytearray()
+        previous_id = None
+        for transaction_id, time, user_name, amount, product_name in sql_session.execute(query):
+            if transaction_id in logged_ids:
+                continue
+            records += RECORD.pack(
+                transaction_id,
+                to_timestamp(time),
+                intern(user_name),
+                intern(product_name) if product_name is not None else -1,
+                amount if transaction_id != previous_id else 0,
+            )
+            previous_id = transaction_id
+
+        # The strings are written first, so that every record refers to a known string
+        if new_strings:
+            with self.strings_path.open("a", encoding="utf-8", newline="\n") as f:
+                f.writelines(string + "\n" for string in new_strings)
+        with self.path.open("ab") as f:
+            f.write(records)
+        return len(records) // RECORD.size
+
+    def rows(self, startDate: date, numberOfDays: int) -> tuple[list, list]:
+        """
+        Read the records from startDate and numberOfDays days on, as rows in the
+        format of purchaseLinesQuery and creditLinesQuery in statistikkHelpers,
+        with the day replaced by the number of days since startDate.
+        """
+        count = self._record_count()
+        strings = self._read_strings()
+        startDay = (startDate - EPOCH.date()).days
+        if count == 0:
+            return [], []
+        with self.path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if np is not None:
+                return self._rows_columnar(mm, count, strings, startDay, numberOfDays)
+            return self._rows_from_records(mm, count, strings, startDay, numberOfDays)
+
+    @staticmethod
+    def _rows_columnar(mm, count, strings, startDay, numberOfDays):
+        records = np.frombuffer(mm, dtype=RECORD_DTYPE, count=count, offset=len(MAGIC))
+        dateNum = records["time"] // SECONDS_PER_DAY - startDay
+        keep = (dateNum >= 0) & (dateNum <= numberOfDays)
+        keep &= np.abs(records["amount"]) <= OUTLIER_LIMIT
+        purchase = keep & (records["product"] >= 0)
+        credit = keep & (records["product"] < 0)
+        strings = np.array(strings, dtype=object)
+
+        # Masking copies the columns out of the map, which is closed after this
+        amount = records["amount"][purchase]
+        purchaseRows = list(
+            zip(
+                dateNum[purchase].tolist(),
+                strings[records["user"][purchase]].tolist(),
+                strings[records["product"][purchase]].tolist(),
+                np.ones(len(amount), dtype=np.int64).tolist(),
+                amount.tolist(),
+                strict=True,
+            ),
+        )
+
+        amount = records["amount"][credit]
+        taken = amount > 0
+        creditRows = list(
+            zip(
+                dateNum[credit].tolist(),
+                strings[records["user"][credit]].tolist(),
+                taken.astype(np.int64).tolist(),
+                np.where(taken, amount, 0).tolist(),
+                (~taken).astype(np.int64).tolist(),
+                np.where(taken, 0, amount).tolist(),
+                strict=True,
+            ),
+        )
+        return purchaseRows, creditRows
+
+    @staticmethod
+    def _rows_from_records(mm, count, strings, startDay, numberOfDays):
+        purchaseRows = []
+        creditRows = []
+        end = len(MAGIC) + count * RECORD.size
+        for _id, time, user, product, amount in RECORD.iter_unpack(mm[len(MAGIC) : end]):
+            dateNum = time // SECONDS_PER_DAY - startDay
+            if dateNum < 0 or dateNum > numberOfDays or abs(amount) > OUTLIER_LIMIT:
+                continue
+            if product >= 0:
+                purchaseRows.append((dateNum, strings[user], strings[product], 1, amount))
+            elif amount > 0:
+                creditRows.append((dateNum, strings[user], 1, amount, 0, 0))
+            else:
+                creditRows.append((dateNum, strings[user], 0, 0, 1, amount))
+        return purchaseRows, creditRows
@@ -2,11 +2,9 @@ import argparse
 import sys
 from pathlib import Path
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
+from dibbler.lib.startup_profile import StartupProfile
 
-from dibbler.conf import config_db_string, load_config
-from dibbler.lib.check_db_health import check_db_health
+# Everything else is imported when it is needed, so that e.g. `dibbler -V` starts quickly
 
 parser = argparse.ArgumentParser()
 
@@ -27,18 +25,117 @@ parser.add_argument(
     default=False,
 )
 
+parser.add_argument(
+    "--verify-schema",
+    help="Compare the database with the models, even if it has been verified before",
+    action="store_true",
+    default=False,
+)
+
+parser.add_argument(
+    "--profile-startup",
+    help="Report the time spent starting up, and exit before running the subcommand",
+    action="store_true",
+    default=False,
+)
+
 subparsers = parser.add_subparsers(
     title="subcommands",
     dest="subcommand",
 )
 subparsers.add_parser("loop", help="Run the dibbler loop")
 subparsers.add_parser("create-db", help="Create the database")
+subparsers.add_parser("migrate", help="Add missing tables and indexes to an existing database")
 subparsers.add_parser("slabbedasker", help="Find out who is slabbedasker")
 subparsers.add_parser("seed-data", help="Fill with mock data")
+subparsers.add_parser(
+    "rebuild-user-products",
+    help="Recompute which products each user has bought from the purchase history",
+)
+reconcile_parser = subparsers.add_parser(
+    "reconcile",
+    help="Check every user's credit against their transaction history",
+)
+reconcile_parser.add_argument(
+    "--snapshot",
+    help="Store the balances derived from the transactions, so later checks start from them",
+    action="store_true",
+    default=False,
+)
+bench_parser = subparsers.add_parser(
+    "bench",
+    help="Time common operations on a database filled with synthetic data",
+)
+bench_parser.add_argument("--users", type=int, default=100, help="Number of users to generate")
+bench_parser.add_argument(
+    "--products",
+    type=int,
+    default=300,
+    help="Number of products to generate",
+)
+bench_parser.add_argument("--days", type=int, default=365, help="Days of history to generate")
+bench_parser.add_argument(
+    "--purchases-per-day",
+    type=int,
+    default=40,
+    help="Average number of purchases per day",
+)
+bench_parser.add_argument("--seed", type=int, default=0, help="Seed for the data generator")
+bench_parser.add_argument("--repeat", type=int, default=10, help="Timed runs of each case")
+bench_parser.add_argument(
+    "--output",
+    help="Write the results as JSON to this file",
+    type=Path,
+    metavar="FILE",
+    default=Path("dibbler-bench.json"),
+)
+bench_parser.add_argument(
+    "--database-url",
+    help="Empty database to benchmark, instead of a temporary SQLite database",
+    metavar="URL",
+)
+throughput_parser = subparsers.add_parser(
+    "throughput",
+    help="Buy from several scripted kiosks at once, and report purchases per second",
+)
+throughput_parser.add_argument(
+    "--kiosks",
+    type=int,
+    default=4,
+    help="Number of kiosks, each in its own process",
+)
+throughput_parser.add_argument(
+    "--purchases",
+    type=int,
+    default=100,
+    help="Purchases made by each kiosk",
+)
+throughput_parser.add_argument("--seed", type=int, default=0, help="Seed for the scripts")
+throughput_parser.add_argument(
+    "--output",
+    help="Also write the results as JSON to this file",
+    type=Path,
+    metavar="FILE",
+)
+throughput_parser.add_argument(
+    "--timeout",
+    type=float,
+    default=600,
+    help="Stop kiosks which have not finished after this many seconds",
+)
+throughput_parser.add_argument(
+    "-y",
+    "--yes",
+    help="Do not ask before storing the purchases",
+    action="store_true",
+    default=False,
+)
 
 
 def main() -> None:
+    profile = StartupProfile()
     args = parser.parse_args()
+    profile.mark("parse arguments")
 
     if args.version:
         from ._version import commit_id, version
@@ -50,11 +147,58 @@ def main() -> None:
         parser.print_help()
         sys.exit(1)
 
+    from sqlalchemy import create_engine
+
+    from dibbler.conf import (
+        config_db_string,
+        config_engine_options,
+        config_sqlite_pragmas,
+        load_config,
+    )
+    from dibbler.lib.check_db_health import check_db_health
+    from dibbler.lib.database import ReconnectingSession, configure_sqlite
+    from dibbler.lib.instrumentation import setup_instrumentation
+
+    profile.mark("import database modules")
+
     load_config(args.config)
+    profile.mark("load config")
+
+    # The benchmark sets up its own database
+    if args.subcommand == "bench":
+        import dibbler.subcommands.bench as bench
+
+        bench.main(
+            users=args.users,
+            products=args.products,
+            days=args.days,
+            purchases_per_day=args.purchases_per_day,
+            seed=args.seed,
+            repeat=args.repeat,
+            output=args.output,
+            database_url=args.database_url,
+        )
+        return
 
-    engine = create_engine(config_db_string())
+    # The kiosks set up their own connections
+    if args.subcommand == "throughput":
+        import dibbler.subcommands.throughput as throughput
 
-    sql_session = Session(
+        throughput.main(
+            kiosks=args.kiosks,
+            purchases=args.purchases,
+            seed=args.seed,
+            output=args.output,
+            assume_yes=args.yes,
+            timeout=args.timeout,
+        )
+        return
+
+    engine = create_engine(config_db_string(), **config_engine_options())
+    if engine.dialect.name == "sqlite":
+        configure_sqlite(engine, config_sqlite_pragmas())
+
+    sql_session = ReconnectingSession(
         engine,
         expire_on_commit=False,
         autocommit=False,
@@ -62,21 +206,40 @@ def main() -> None:
         close_resets_only=True,
     )
 
+    setup_instrumentation(engine, sql_session)
+
     check_db_health(
         engine,
-        verify_table_existence=args.subcommand != "create-db",
+        verify_table_existence=args.subcommand not in ("create-db", "migrate"),
+        verify_schema=args.verify_schema,
     )
+    profile.mark("connect and check database")
 
     if args.subcommand == "loop":
         import dibbler.subcommands.loop as loop
 
-        loop.main(sql_session)
+        profile.mark("import loop")
+        main_menu = loop.build_main_menu(sql_session)
+        profile.mark("build main menu")
+        if args.profile_startup:
+            profile.report()
+            return
+        loop.main(sql_session, main_menu)
+
+    elif args.profile_startup:
+        profile.report()
+        return
 
     elif args.subcommand == "create-db":
         import dibbler.subcommands.makedb as makedb
 
         makedb.main(engine)
 
+    elif args.subcommand == "migrate":
+        import dibbler.subcommands.migrate as migrate
+
+        migrate.main(engine)
+
     elif args.subcommand == "slabbedasker":
         import dibbler.subcommands.slabbedasker as slabbedasker
 
@@ -87,6 +250,16 @@ def main() -> None:
 
         seed_test_data.main(sql_session)
 
+    elif args.subcommand == "rebuild-user-products":
+        import dibbler.subcommands.rebuild_user_products as rebuild_user_products
+
+        rebuild_user_products.main(sql_session)
+
+    elif args.subcommand == "reconcile":
+        import dibbler.subcommands.reconcile as reconcile
+
+        reconcile.main(sql_session, snapshot=args.snapshot)
+
 
 if __name__ == "__main__":
     main()
@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 __all__ = [
     "AddProductMenu",
     "AddStockMenu",
@@ -10,6 +12,7 @@ __all__ = [
     "EditProductMenu",
     "EditUserMenu",
     "FAQMenu",
+    "LazyMenu",
     "LoggedStatisticsMenu",
     "MainMenu",
     "Menu",
@@ -23,31 +26,72 @@ __all__ = [
     "UserListMenu",
 ]
 
-from .addstock import AddStockMenu
-from .buymenu import BuyMenu
-from .editing import (
-    AddProductMenu,
-    AddUserMenu,
-    AdjustStockMenu,
-    CleanupStockMenu,
-    EditProductMenu,
-    EditUserMenu,
-)
-from .faq import FAQMenu
-from .helpermenus import Menu
-from .mainmenu import MainMenu
-from .miscmenus import (
-    AdjustCreditMenu,
-    ProductListMenu,
-    ProductSearchMenu,
-    ShowUserMenu,
-    TransferMenu,
-    UserListMenu,
-)
-from .printermenu import PrintLabelMenu
-from .stats import (
-    BalanceMenu,
-    LoggedStatisticsMenu,
-    ProductPopularityMenu,
-    ProductRevenueMenu,
-)
+import importlib
+from typing import TYPE_CHECKING
+
+# The menus are imported from their modules on first use, since some of
+# them, like the statistics menus, pull in heavy dependencies
+_MENU_MODULES = {
+    "AddProductMenu": ".editing",
+    "AddStockMenu": ".addstock",
+    "AddUserMenu": ".editing",
+    "AdjustCreditMenu": ".miscmenus",
+    "AdjustStockMenu": ".editing",
+    "BalanceMenu": ".stats",
+    "BuyMenu": ".buymenu",
+    "CleanupStockMenu": ".editing",
+    "EditProductMenu": ".editing",
+    "EditUserMenu": ".editing",
+    "FAQMenu": ".faq",
+    "LazyMenu": ".helpermenus",
+    "LoggedStatisticsMenu": ".stats",
+    "MainMenu": ".mainmenu",
+    "Menu": ".helpermenus",
+    "PrintLabelMenu": ".printermenu",
+    "ProductListMenu": ".miscmenus",
+    "ProductPopularityMenu": ".stats",
+    "ProductRevenueMenu": ".stats",
+    "ProductSearchMenu": ".miscmenus",
+    "ShowUserMenu": ".miscmenus",
+    "TransferMenu": ".miscmenus",
+    "UserListMenu": ".miscmenus",
+}
+
+
+def __getattr__(name: str) -> type[Menu]:
+    if name not in _MENU_MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_MENU_MODULES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+if TYPE_CHECKING:
+    from .addstock import AddStockMenu
+    from .buymenu import BuyMenu
+    from .editing import (
+        AddProductMenu,
+        AddUserMenu,
+        AdjustStockMenu,
+        CleanupStockMenu,
+        EditProductMenu,
+        EditUserMenu,
+    )
+    from .faq import FAQMenu
+    from .helpermenus import LazyMenu, Menu
+    from .mainmenu import MainMenu
+    from .miscmenus import (
+        AdjustCreditMenu,
+        ProductListMenu,
+        ProductSearchMenu,
+        ShowUserMenu,
+        TransferMenu,
+        UserListMenu,
+    )
+    from .printermenu import PrintLabelMenu
+    from .stats import (
+        BalanceMenu,
+        LoggedStatisticsMenu,
+        ProductPopularityMenu,
+        ProductRevenueMenu,
+    )
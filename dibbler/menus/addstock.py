@@ -3,6 +3,7 @@ from math import ceil
 import sqlalchemy
 from sqlalchemy.orm import Session
 
+from dibbler.lib.purchases import update_user_products
 from dibbler.models import (
     Product,
     Purchase,
@@ -134,17 +135,14 @@ much money you're due in credits for the purchase when prompted.\n"""
         description = self.input_str("Log message", length_range=(0, 50))
         if description == "":
             description = "Purchased products for PVVVV, adjusted credit " + str(self.price)
-        for product in self.products:
-            value = max(product.stock, 0) * product.price + self.products[product][1]
+        for product, (amount, paid) in self.products.items():
+            # The stock is added to by the database, so that purchases made
+            # meanwhile at other terminals are not lost
+            new_stock = product.restock(amount)
+            value = (new_stock - amount) * product.price + paid
             old_price = product.price
             old_hidden = product.hidden
-            product.price = int(
-                ceil(float(value) / (max(product.stock, 0) + self.products[product][0])),
-            )
-            product.stock = max(
-                self.products[product][0],
-                product.stock + self.products[product][0],
-            )
+            product.price = int(ceil(float(value) / new_stock))
             product.hidden = False
             print(
                 f"New stock for {product.name}: {product.stock:d}",
@@ -162,6 +160,8 @@ much money you're due in credits for the purchase when prompted.\n"""
         self.sql_session.add(purchase)
 
         try:
+            self.sql_session.flush()
+            update_user_products(self.sql_session, purchase)
             self.sql_session.commit()
             print("Success! Transaction performed:")
             # self.print_info()
@@ -5,6 +5,8 @@ from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
 from dibbler.conf import config
+from dibbler.lib.instrumentation import get_instrumentation
+from dibbler.lib.purchases import commit_purchase
 from dibbler.models import (
     Product,
     Purchase,
@@ -185,15 +187,16 @@ When finished, write an empty line to confirm the purchase.\n"""
             if self.superfast_mode and isinstance(thing, User):
                 break
 
-        self.purchase.perform_purchase()
-        self.sql_session.add(self.purchase)
         try:
-            self.sql_session.commit()
+            statements = commit_purchase(self.sql_session, self.purchase)
         except SQLAlchemyError as e:
             self.sql_session.rollback()
             print(f"Could not store purchase: {e}")
         else:
             print("Purchase stored.")
+            instrumentation = get_instrumentation(self.sql_session)
+            if instrumentation is not None:
+                instrumentation.add_purchase(statements)
             self.print_purchase()
             for t in self.purchase.transactions:
                 if not t.user.is_anonymous():
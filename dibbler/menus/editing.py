@@ -192,7 +192,7 @@ class AdjustStockMenu(Menu):
         else:
             print(f"You removed {add_stock:d} from the stock of {product}")
 
-        product.stock += add_stock
+        product.adjust_stock(add_stock)
 
         try:
             self.sql_session.commit()
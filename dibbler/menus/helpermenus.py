@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import importlib
 import re
 import sys
+import time
 from select import select
 from typing import TYPE_CHECKING, Any, Literal, Self, TypeVar
 
@@ -11,6 +13,8 @@ from dibbler.lib.helpers import (
     search_product,
     search_user,
 )
+from dibbler.lib.idle_prefetch import get_idle_prefetcher
+from dibbler.lib.instrumentation import get_instrumentation
 from dibbler.models import Product, User
 
 if TYPE_CHECKING:
@@ -43,6 +47,8 @@ class Menu:
     exit_disallowed_msg: str | None
     help_text: str | None
     context: str | None
+    # Whether executions of this menu are counted by the instrumentation
+    instrumented: bool = True
 
     def __init__(
         self,
@@ -129,6 +135,20 @@ class Menu:
             return i
         return self.items[i]
 
+    def read_line(self, prompt: str) -> str:
+        """
+        Read a line of input. If idle prefetching is enabled, the session is
+        warmed up at intervals while waiting for it.
+        """
+        prefetcher = get_idle_prefetcher(self.sql_session)
+        if prefetcher is None or not sys.stdin.isatty():
+            return input(prompt)
+        sys.stdout.write(prompt)
+        sys.stdout.flush()
+        while not select([sys.stdin], [], [], prefetcher.interval)[0]:
+            prefetcher.prefetch(self.sql_session)
+        return input()
+
     def input_str(
         self,
         prompt: str | None = None,
@@ -150,6 +170,7 @@ class Menu:
         else:
             prompt += " "
         while True:
+            waiting_since = time.perf_counter()
             try:
                 if timeout:
                     # assuming line buffering
@@ -162,11 +183,15 @@ class Menu:
                     else:
                         result = input(prompt).strip()
                 else:
-                    result = input(prompt).strip()
+                    result = self.read_line(prompt).strip()
             except EOFError:
                 print("quit")
                 self.exit_menu()
                 continue
+            finally:
+                instrumentation = get_instrumentation(self.sql_session)
+                if instrumentation is not None:
+                    instrumentation.add_input_time(time.perf_counter() - waiting_since)
             if result in exit_commands:
                 self.exit_menu()
                 continue
@@ -499,7 +524,7 @@ class Menu:
         limit = 9
         if len(result) > limit:
             select_header = (
-                f'{len(result):d} {thing}s matching "{search_str}"; showing first {limit:d}'
+                f'{len(result):d} {thing}s matching "{search_str}"; showing best {limit:d}'
             )
             select_items = result[:limit]
         else:
@@ -575,11 +600,17 @@ class Menu:
 
     def execute(self, **_kwargs) -> MenuItemType | int | None:
         self.set_context(None)
+        instrumentation = get_instrumentation(self.sql_session) if self.instrumented else None
+        if instrumentation is not None:
+            instrumentation.enter(self.name)
         try:
             return self._execute(**_kwargs)
         except ExitMenuException:
             self.at_exit()
             return None
+        finally:
+            if instrumentation is not None:
+                instrumentation.exit()
 
     def _execute(self, **_kwargs) -> MenuItemType | int | None:
         while True:
@@ -599,6 +630,39 @@ class Menu:
                 return self.item_value(item_i)
 
 
+class LazyMenu(Menu):
+    """
+    Stand-in for a submenu, which imports and constructs the real menu the
+    first time it is selected.
+
+    The real menu is constructed as `class_name(sql_session, **kwargs)`,
+    where `class_name` is looked up in the module `module`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        sql_session: Session,
+        module: str,
+        class_name: str,
+        **kwargs: object,
+    ) -> None:
+        super().__init__(name, sql_session)
+        self.module = module
+        self.class_name = class_name
+        self.kwargs = kwargs
+        self._menu: Menu | None = None
+
+    def menu(self) -> Menu:
+        if self._menu is None:
+            menu_class = getattr(importlib.import_module(self.module), self.class_name)
+            self._menu = menu_class(self.sql_session, **self.kwargs)
+        return self._menu
+
+    def execute(self, **_kwargs) -> MenuItemType | int | None:
+        return self.menu().execute(**_kwargs)
+
+
 class MessageMenu(Menu):
     message: str
     pause_after_message: bool
@@ -623,6 +687,8 @@ class MessageMenu(Menu):
 
 
 class ConfirmMenu(Menu):
+    instrumented = False
+
     def __init__(
         self,
         sql_session: Session,
@@ -660,6 +726,8 @@ class ConfirmMenu(Menu):
 
 
 class Selector(Menu):
+    instrumented = False
+
     def __init__(
         self,
         name: str,
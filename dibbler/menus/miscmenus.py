@@ -1,10 +1,15 @@
-import sqlalchemy
+import itertools
+from collections.abc import Iterator
+
+from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
 from dibbler.conf import config
-from dibbler.lib.helpers import less
-from dibbler.models import Product, Transaction, User
+from dibbler.lib.helpers import PAGER_BATCH_SIZE, less
+from dibbler.lib.summary import product_listing
+from dibbler.lib.transaction_history import TransactionHistory
+from dibbler.models import Product, Transaction, User, UserProducts
 
 from .helpermenus import Menu, Selector
 
@@ -77,17 +82,20 @@ class ShowUserMenu(Menu):
         else:
             print("What what?")
 
-    @staticmethod
-    def print_transactions(user: User, limit: int | None = None) -> None:
-        num_trans = len(user.transactions)
+    def print_transactions(self, user: User, limit: int | None = None) -> None:
+        less(self.transaction_lines(user, limit))
+
+    def transaction_lines(self, user: User, limit: int | None = None) -> Iterator[str]:
+        history = TransactionHistory(self.sql_session, user)
+        num_trans = history.count()
         if limit is None:
             limit = num_trans
         if num_trans <= limit:
-            string = f"{user.name}'s transactions ({num_trans:d}):\n"
+            yield f"{user.name}'s transactions ({num_trans:d}):\n"
         else:
-            string = f"{user.name}'s transactions ({num_trans:d}, showing only last {limit:d}):\n"
-        for t in user.transactions[-1 : -limit - 1 : -1]:
-            string += f" * {t.time.isoformat(' ')}: {'in' if t.amount < 0 else 'out'} {abs(t.amount)} kr, "
+            yield f"{user.name}'s transactions ({num_trans:d}, showing only last {limit:d}):\n"
+        for t in (t for page in history.pages(limit) for t in page):
+            string = f" * {t.time.isoformat(' ')}: {'in' if t.amount < 0 else 'out'} {abs(t.amount)} kr, "
             if t.purchase:
                 products = []
                 for entry in t.purchase.entries:
@@ -101,26 +109,29 @@ class ShowUserMenu(Menu):
                     string += f" * {t.penalty:d}x penalty applied"
             elif t.description is not None:
                 string += t.description
-            string += "\n"
-        less(string)
-
-    @staticmethod
-    def print_purchased_products(user: User) -> None:
-        products = []
-        for ref in user.products:
-            product = ref.product
-            count = ref.count
-            if count > 0:
-                products.append((product, count))
-        num_products = len(products)
-        if num_products == 0:
+            yield string + "\n"
+
+    def print_purchased_products(self, user: User) -> None:
+        products = iter(
+            self.sql_session.execute(
+                select(UserProducts.count, Product.name)
+                .join(UserProducts.product)
+                .where(UserProducts.user_name == user.name, UserProducts.count > 0)
+                .order_by(UserProducts.count.desc())
+                .execution_options(yield_per=PAGER_BATCH_SIZE),
+            ),
+        )
+        first = next(products, None)
+        if first is None:
             print("No products purchased yet")
-        else:
-            text = ""
-            text += "Products purchased:\n"
-            for product, count in products:
-                text += f"{product.name:<47} {count:>3}\n"
-            less(text)
+            return
+
+        def lines() -> Iterator[str]:
+            yield "Products purchased:\n"
+            for count, name in itertools.chain([first], products):
+                yield f"{name:<47} {count:>3}\n"
+
+        less(lines())
 
 
 class UserListMenu(Menu):
@@ -129,19 +140,21 @@ class UserListMenu(Menu):
 
     def _execute(self, **_kwargs) -> None:
         self.print_header()
-        user_list = self.sql_session.query(User).all()
-        total_credit = self.sql_session.query(sqlalchemy.func.sum(User.credit)).first()[0]
+        less(self.user_list_lines())
 
+    def user_list_lines(self) -> Iterator[str]:
         line_format = "%-12s | %6s\n"
         hline = "---------------------\n"
-        text = ""
-        text += line_format % ("username", "credit")
-        text += hline
-        for user in user_list:
-            text += line_format % (user.name, user.credit)
-        text += hline
-        text += line_format % ("total credit", total_credit)
-        less(text)
+        yield line_format % ("username", "credit")
+        yield hline
+        total_credit = 0
+        for user in self.sql_session.scalars(
+            select(User).execution_options(yield_per=PAGER_BATCH_SIZE),
+        ):
+            total_credit += user.credit
+            yield line_format % (user.name, user.credit)
+        yield hline
+        yield line_format % ("total credit", total_credit)
 
 
 class AdjustCreditMenu(Menu):
@@ -181,28 +194,24 @@ class ProductListMenu(Menu):
 
     def _execute(self, **_kwargs) -> None:
         self.print_header()
-        text = ""
-        product_list = (
-            self.sql_session.query(Product)
-            .filter(Product.hidden.is_(False))
-            .order_by(Product.stock.desc())
-        )
-        total_value = 0
-        for p in product_list:
-            total_value += p.price * p.stock
+        less(self.product_list_lines())
+
+    def product_list_lines(self) -> Iterator[str]:
         line_format = "%-15s | %5s | %-" + str(Product.name_length) + "s | %5s \n"
-        text += line_format % ("bar code", "price", "name", "stock")
-        text += 78 * "-" + "\n"
-        for p in product_list:
-            text += line_format % (p.bar_code, p.price, p.name, p.stock)
-        text += 78 * "-" + "\n"
-        text += line_format % (
+        yield line_format % ("bar code", "price", "name", "stock")
+        yield 78 * "-" + "\n"
+        # Every row has the total, and there are none if nothing is listed
+        total_value = 0
+        for p, listing_total in product_listing(self.sql_session, yield_per=PAGER_BATCH_SIZE):
+            total_value = listing_total
+            yield line_format % (p.bar_code, p.price, p.name, p.stock)
+        yield 78 * "-" + "\n"
+        yield line_format % (
             "Total value",
             total_value,
             "",
             "",
         )
-        less(text)
 
 
 class ProductSearchMenu(Menu):
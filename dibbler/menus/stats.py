@@ -1,9 +1,12 @@
-from sqlalchemy import desc, func
+from collections.abc import Iterator
+
 from sqlalchemy.orm import Session
 
 from dibbler.lib.helpers import less
+from dibbler.lib.product_sales import get_product_sales
 from dibbler.lib.statistikkHelpers import statisticsTextOnly
-from dibbler.models import Product, PurchaseEntry, User
+from dibbler.lib.summary import balance_summary
+from dibbler.models import Product
 
 from .helpermenus import Menu
 
@@ -21,31 +24,15 @@ class ProductPopularityMenu(Menu):
 
     def _execute(self, **_kwargs) -> None:
         self.print_header()
-        text = ""
-        sub = (
-            self.sql_session.query(
-                PurchaseEntry.product_id,
-                func.sum(PurchaseEntry.amount).label("purchase_count"),
-            )
-            .filter(PurchaseEntry.amount > 0)
-            .group_by(PurchaseEntry.product_id)
-            .subquery()
-        )
-        product_list = (
-            self.sql_session.query(Product, sub.c.purchase_count)
-            .outerjoin(sub, Product.product_id == sub.c.product_id)
-            .order_by(desc(sub.c.purchase_count))
-            .filter(sub.c.purchase_count is not None)
-            .all()
-        )
+        less(self.popularity_lines())
+
+    def popularity_lines(self) -> Iterator[str]:
+        product_list = get_product_sales(self.sql_session).ranked(self.sql_session)
         line_format = "{0:10s} | {1:>45s}\n"
-        text += line_format.format("items sold", "product")
-        text += "-" * (31 + Product.name_length) + "\n"
+        yield line_format.format("items sold", "product")
+        yield "-" * (31 + Product.name_length) + "\n"
         for product, number in product_list:
-            if number is None:
-                continue
-            text += line_format.format(str(number), product.name)
-        less(text)
+            yield line_format.format(str(number), product.name)
 
 
 class ProductRevenueMenu(Menu):
@@ -54,36 +41,23 @@ class ProductRevenueMenu(Menu):
 
     def _execute(self, **_kwargs) -> None:
         self.print_header()
-        text = ""
-        sub = (
-            self.sql_session.query(
-                PurchaseEntry.product_id,
-                func.sum(PurchaseEntry.amount).label("purchase_count"),
-            )
-            .filter(PurchaseEntry.amount > 0)
-            .group_by(PurchaseEntry.product_id)
-            .subquery()
-        )
-        product_list = (
-            self.sql_session.query(Product, sub.c.purchase_count)
-            .outerjoin(sub, Product.product_id == sub.c.product_id)
-            .order_by(desc(sub.c.purchase_count * Product.price))
-            .filter(sub.c.purchase_count is not None)
-            .all()
+        less(self.revenue_lines())
+
+    def revenue_lines(self) -> Iterator[str]:
+        product_list = get_product_sales(self.sql_session).ranked(
+            self.sql_session,
+            by_revenue=True,
         )
         line_format = "{0:7s} | {1:10s} | {2:6s} | {3:>45s}\n"
-        text += line_format.format("revenue", "items sold", "price", "product")
-        text += "-" * (31 + Product.name_length) + "\n"
+        yield line_format.format("revenue", "items sold", "price", "product")
+        yield "-" * (31 + Product.name_length) + "\n"
         for product, number in product_list:
-            if number is None:
-                continue
-            text += line_format.format(
+            yield line_format.format(
                 str(number * product.price),
                 str(number),
                 str(product.price),
                 product.name,
             )
-        less(text)
 
 
 class BalanceMenu(Menu):
@@ -92,21 +66,12 @@ class BalanceMenu(Menu):
 
     def _execute(self, **_kwargs) -> None:
         self.print_header()
+        less(self.format_balance())
+
+    def format_balance(self) -> str:
         text = ""
-        total_value = 0
-        product_list = self.sql_session.query(Product).filter(Product.stock > 0).all()
-        for p in product_list:
-            total_value += p.stock * p.price
-
-        total_positive_credit = (
-            self.sql_session.query(func.coalesce(func.sum(User.credit), 0))
-            .filter(User.credit > 0)
-            .first()[0]
-        )
-        total_negative_credit = (
-            self.sql_session.query(func.coalesce(func.sum(User.credit), 0))
-            .filter(User.credit < 0)
-            .first()[0]
+        total_value, total_positive_credit, total_negative_credit = balance_summary(
+            self.sql_session,
         )
 
         total_credit = total_positive_credit + total_negative_credit
@@ -120,7 +85,7 @@ class BalanceMenu(Menu):
         text += line_format % ("Total credit", total_credit)
         text += 24 * "-" + "\n"
         text += line_format % ("Total balance", total_balance)
-        less(text)
+        return text
 
 
 class LoggedStatisticsMenu(Menu):
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from datetime import datetime  # noqa: TC003 (SQLAlchemy resolves Mapped[datetime] at runtime)
+
+from sqlalchemy import (
+    DateTime,
+    ForeignKey,
+    Integer,
+)
+from sqlalchemy.orm import (
+    Mapped,
+    mapped_column,
+)
+
+from .Base import Base
+
+
+class BalanceSnapshot(Base):
+    """
+    A user's balance as derived from all transactions up to and including `time`.
+    """
+
+    __tablename__ = "balance_snapshots"
+
+    user_name: Mapped[str] = mapped_column(ForeignKey("users.name"), primary_key=True)
+    time: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+
+    credit: Mapped[int] = mapped_column(Integer)
+
+    def __init__(self, user_name: str, time: datetime, credit: int) -> None:
+        self.user_name = user_name
+        self.time = time
+        self.credit = credit
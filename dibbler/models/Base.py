@@ -1,8 +1,9 @@
-from sqlalchemy import MetaData
+from sqlalchemy import DDL, MetaData, case, event, inspect, update
 from sqlalchemy.orm import (
     DeclarativeBase,
     declared_attr,
 )
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.orm.collections import (
     InstrumentedDict,
     InstrumentedList,
@@ -42,3 +43,47 @@ class Base(DeclarativeBase):
             )
         )
         return f"<{self.__class__.__name__}({columns})>"
+
+    def increment(self, attribute: str, amount: int, floor: int | None = None) -> int:
+        """
+        Add `amount` to a numeric column of this row in the database, and
+        return the new value. If `floor` is given, a current value below it
+        counts as `floor`.
+
+        The addition is done by the database, in a single
+        `UPDATE ... RETURNING`, so concurrent sessions changing the same
+        row can not overwrite each other's changes. Rows which are not in
+        the database yet are changed in memory instead.
+        """
+        state = inspect(self)
+        if not state.persistent:
+            current = getattr(self, attribute)
+            if floor is not None:
+                current = max(current, floor)
+            setattr(self, attribute, current + amount)
+            return getattr(self, attribute)
+
+        cls = type(self)
+        column = getattr(cls, attribute)
+        where = [
+            key_column == value
+            for key_column, value in zip(state.mapper.primary_key, state.identity, strict=True)
+        ]
+        current = column if floor is None else case((column < floor, floor), else_=column)
+        value = state.session.execute(
+            update(cls)
+            .where(*where)
+            .values({column: current + amount})
+            .returning(column)
+            .execution_options(synchronize_session=False),
+        ).scalar_one()
+        set_committed_value(self, attribute, value)
+        return value
+
+
+# The trigram indexes used for name search on Postgres need pg_trgm
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from datetime import date  # noqa: TC003 (SQLAlchemy resolves Mapped[date] at runtime)
+
+from sqlalchemy import (
+    Date,
+    ForeignKey,
+    Integer,
+)
+from sqlalchemy.orm import (
+    Mapped,
+    mapped_column,
+)
+
+from .Base import Base
+
+
+class CreditRollup(Base):
+    """
+    The transactions of one user on one day which are not purchases, summed
+    separately for money taken from and added to the box.
+    """
+
+    __tablename__ = "credit_rollups"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    user_name: Mapped[str] = mapped_column(ForeignKey("users.name"), primary_key=True)
+
+    taken_count: Mapped[int] = mapped_column(Integer)
+    taken: Mapped[int] = mapped_column(Integer)
+    added_count: Mapped[int] = mapped_column(Integer)
+    added: Mapped[int] = mapped_column(Integer)
+
+    def __init__(self, day: date, user_name: str) -> None:
+        self.day = day
+        self.user_name = user_name
+        self.taken_count = 0
+        self.taken = 0
+        self.added_count = 0
+        self.added = 0
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from sqlalchemy import (
+    String,
+    Text,
+)
+from sqlalchemy.orm import (
+    Mapped,
+    mapped_column,
+)
+
+from .Base import Base
+
+
+class Meta(Base):
+    """
+    Small pieces of bookkeeping state, such as how far derived tables
+    have been brought up to date.
+    """
+
+    __tablename__ = "meta"
+
+    key: Mapped[str] = mapped_column(String(50), primary_key=True)
+    value: Mapped[str] = mapped_column(Text)
+
+    def __init__(self, key: str, value: str) -> None:
+        self.key = key
+        self.value = value
@@ -4,6 +4,7 @@ from typing import TYPE_CHECKING
 
 from sqlalchemy import (
     Boolean,
+    Index,
     Integer,
     String,
 )
@@ -22,9 +23,17 @@ if TYPE_CHECKING:
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        Index(
+            "ix_products_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
 
     product_id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    bar_code: Mapped[str] = mapped_column(String(13))
+    bar_code: Mapped[str] = mapped_column(String(13), index=True)
     name: Mapped[str] = mapped_column(String(45))
     price: Mapped[int] = mapped_column(Integer)
     stock: Mapped[int] = mapped_column(Integer)
@@ -53,3 +62,16 @@ class Product(Base):
 
     def __str__(self) -> str:
         return self.name
+
+    def adjust_stock(self, amount: int) -> int:
+        """
+        Add `amount` to this product's stock in the database, and return the new stock.
+        """
+        return self.increment("stock", amount)
+
+    def restock(self, amount: int) -> int:
+        """
+        Add `amount` new items to this product's stock in the database, with a
+        negative stock counting as empty, and return the new stock.
+        """
+        return self.increment("stock", amount, floor=0)
@@ -59,7 +59,7 @@ class Purchase(Base):
         for t in self.transactions:
             t.perform_transaction(ignore_penalty=ignore_penalty)
         for entry in self.entries:
-            entry.product.stock -= entry.amount
+            entry.product.adjust_stock(-entry.amount)
 
     def perform_soft_purchase(self, price: int, round_up: bool = True) -> None:
         self.time = datetime.now()
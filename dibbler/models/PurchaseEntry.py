@@ -25,8 +25,8 @@ class PurchaseEntry(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     amount: Mapped[int] = mapped_column(Integer)
 
-    product_id: Mapped[int] = mapped_column(ForeignKey("products.product_id"))
-    purchase_id: Mapped[int] = mapped_column(ForeignKey("purchases.id"))
+    product_id: Mapped[int] = mapped_column(ForeignKey("products.product_id"), index=True)
+    purchase_id: Mapped[int] = mapped_column(ForeignKey("purchases.id"), index=True)
 
     product: Mapped[Product] = relationship(back_populates="purchases", lazy="joined")
     purchase: Mapped[Purchase] = relationship(back_populates="entries", lazy="joined")
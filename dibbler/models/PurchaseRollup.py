@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from datetime import date  # noqa: TC003 (SQLAlchemy resolves Mapped[date] at runtime)
+
+from sqlalchemy import (
+    Date,
+    ForeignKey,
+    Integer,
+)
+from sqlalchemy.orm import (
+    Mapped,
+    mapped_column,
+)
+
+from .Base import Base
+
+
+class PurchaseRollup(Base):
+    """
+    The purchase lines of one user and product on one day, summed.
+
+    See `dibbler.lib.rollups` for how lines and amounts are counted.
+    """
+
+    __tablename__ = "purchase_rollups"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    user_name: Mapped[str] = mapped_column(ForeignKey("users.name"), primary_key=True)
+    product_id: Mapped[int] = mapped_column(ForeignKey("products.product_id"), primary_key=True)
+
+    lines: Mapped[int] = mapped_column(Integer)
+    amount: Mapped[int] = mapped_column(Integer)
+
+    def __init__(self, day: date, user_name: str, product_id: int) -> None:
+        self.day = day
+        self.user_name = user_name
+        self.product_id = product_id
+        self.lines = 0
+        self.amount = 0
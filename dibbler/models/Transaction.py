@@ -27,13 +27,13 @@ class Transaction(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
-    time: Mapped[datetime] = mapped_column(DateTime)
+    time: Mapped[datetime] = mapped_column(DateTime, index=True)
     amount: Mapped[int] = mapped_column(Integer)
     penalty: Mapped[int] = mapped_column(Integer)
     description: Mapped[str | None] = mapped_column(String(50))
 
-    user_name: Mapped[str] = mapped_column(ForeignKey("users.name"))
-    purchase_id: Mapped[int | None] = mapped_column(ForeignKey("purchases.id"))
+    user_name: Mapped[str] = mapped_column(ForeignKey("users.name"), index=True)
+    purchase_id: Mapped[int | None] = mapped_column(ForeignKey("purchases.id"), index=True)
 
     user: Mapped[User] = relationship(lazy="joined")
     purchase: Mapped[Purchase] = relationship(back_populates="transactions", lazy="joined")
@@ -56,4 +56,4 @@ class Transaction(Base):
         self.time = datetime.now()
         if not ignore_penalty:
             self.amount *= self.penalty
-        self.user.credit -= self.amount
+        self.user.adjust_credit(-self.amount)
@@ -3,6 +3,7 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 
 from sqlalchemy import (
+    Index,
     Integer,
     String,
 )
@@ -21,10 +22,19 @@ if TYPE_CHECKING:
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index(
+            "ix_users_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
+
     name: Mapped[str] = mapped_column(String(10), primary_key=True)
     credit: Mapped[int] = mapped_column(Integer)
-    card: Mapped[str | None] = mapped_column(String(20))
-    rfid: Mapped[str | None] = mapped_column(String(20))
+    card: Mapped[str | None] = mapped_column(String(20), index=True)
+    rfid: Mapped[str | None] = mapped_column(String(20), index=True)
 
     products: Mapped[list[UserProducts]] = relationship(back_populates="user")
     transactions: Mapped[list[Transaction]] = relationship(
@@ -55,5 +65,11 @@ class User(Base):
     def __str__(self) -> str:
         return self.name
 
+    def adjust_credit(self, amount: int) -> int:
+        """
+        Add `amount` to this user's credit in the database, and return the new credit.
+        """
+        return self.increment("credit", amount)
+
     def is_anonymous(self) -> bool:
         return self.card == "11122233"
@@ -25,6 +25,8 @@ class UserProducts(Base):
     user_name: Mapped[str] = mapped_column(ForeignKey("users.name"), primary_key=True)
     product_id: Mapped[int] = mapped_column(ForeignKey("products.product_id"), primary_key=True)
 
+    # Net number of the product bought by the user, where products the user
+    # has added to the stock count negatively. `sign` is the sign of `count`.
     count: Mapped[int] = mapped_column(Integer)
     sign: Mapped[int] = mapped_column(Integer)
 
@@ -1,17 +1,25 @@
 __all__ = [
+    "BalanceSnapshot",
     "Base",
+    "CreditRollup",
+    "Meta",
     "Product",
     "Purchase",
     "PurchaseEntry",
+    "PurchaseRollup",
     "Transaction",
     "User",
     "UserProducts",
 ]
 
+from .BalanceSnapshot import BalanceSnapshot
 from .Base import Base
+from .CreditRollup import CreditRollup
+from .Meta import Meta
 from .Product import Product
 from .Purchase import Purchase
 from .PurchaseEntry import PurchaseEntry
+from .PurchaseRollup import PurchaseRollup
 from .Transaction import Transaction
 from .User import User
 from .UserProducts import UserProducts
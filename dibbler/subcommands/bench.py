@@ -0,0 +1,226 @@
+#!/usr/bin/python
+
+import contextlib
+import io
+import json
+import statistics
+import tempfile
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import Engine, create_engine, event, select
+
+from dibbler.conf import config, config_engine_options, config_sqlite_pragmas
+from dibbler.lib.database import ReconnectingSession, configure_sqlite
+from dibbler.lib.purchases import commit_purchase
+from dibbler.lib.statistikkHelpers import buildDatabaseFromDb
+from dibbler.lib.synthetic_data import generate
+from dibbler.lib.transaction_log import TransactionLog
+from dibbler.menus import BalanceMenu, BuyMenu, ShowUserMenu, UserListMenu
+from dibbler.models import Base, Product, Purchase, PurchaseEntry, Transaction, User
+
+# The generated history always ends here, so that the same arguments give the same database
+BENCH_END = datetime(2025, 1, 1)
+
+# Number of users and products the scan cases cycle through
+SAMPLE_SIZE = 50
+
+
+class QueryCounter:
+    def __init__(self, engine: Engine) -> None:
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *_args: object) -> None:
+        self.count += 1
+
+
+def run_case(
+    function: Callable[[int], Any],
+    repeat: int,
+    counter: QueryCounter,
+) -> dict[str, float]:
+    """
+    Run `function` once to warm up caches, and then `repeat` times, timing each run.
+    """
+    function(0)
+    timings = []
+    queries = counter.count
+    for i in range(1, repeat + 1):
+        started_at = time.perf_counter()
+        function(i)
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return {
+        "median_ms": statistics.median(timings),
+        "min_ms": min(timings),
+        "max_ms": max(timings),
+        "queries": (counter.count - queries) / repeat,
+    }
+
+
+def version_info() -> dict[str, str | None]:
+    try:
+        from dibbler._version import commit_id, version
+    except ImportError:
+        return {"version": None, "commit_id": None}
+    return {"version": version, "commit_id": commit_id or None}
+
+
+def main(
+    users: int = 100,
+    products: int = 300,
+    days: int = 365,
+    purchases_per_day: int = 40,
+    seed: int = 0,
+    repeat: int = 10,
+    output: Path | None = None,
+    database_url: str | None = None,
+) -> None:
+    """
+    Fill an empty database with synthetic data, and time the code paths used
+    most at the kiosk. By default, a temporary SQLite database is used.
+    """
+    with tempfile.TemporaryDirectory(prefix="dibbler-bench-") as tmpdir:
+        if database_url is None:
+            database_url = f"sqlite:///{Path(tmpdir) / 'bench.db'}"
+        engine = create_engine(database_url, **config_engine_options())
+        if engine.dialect.name == "sqlite":
+            configure_sqlite(engine, config_sqlite_pragmas())
+        sql_session = ReconnectingSession(
+            engine,
+            expire_on_commit=False,
+            autocommit=False,
+            autoflush=False,
+            close_resets_only=True,
+        )
+
+        Base.metadata.create_all(engine)
+        if sql_session.scalar(select(User.name).limit(1)) is not None:
+            print(f"The database at {engine.url!r} is not empty, refusing to benchmark it")
+            return
+
+        print(
+            f"Generating {users} users, {products} products "
+            f"and {days} days of {purchases_per_day} purchases per day...",
+        )
+        started_at = time.perf_counter()
+        generate(
+            sql_session,
+            users=users,
+            products=products,
+            days=days,
+            purchases_per_day=purchases_per_day,
+            seed=seed,
+            end=BENCH_END,
+        )
+        print(f"Generated in {time.perf_counter() - started_at:.1f} s")
+
+        results = run_cases(sql_session, QueryCounter(engine), repeat, days, Path(tmpdir))
+        sql_session.close()
+        engine.dispose()
+
+    line_format = "{0:<20s} | {1:>10s} | {2:>10s} | {3:>10s} | {4:>8s}"
+    print(line_format.format("case", "median ms", "min ms", "max ms", "queries"))
+    print("-" * 70)
+    for name, result in results.items():
+        print(
+            line_format.format(
+                name,
+                f"{result['median_ms']:.2f}",
+                f"{result['min_ms']:.2f}",
+                f"{result['max_ms']:.2f}",
+                f"{result['queries']:g}",
+            ),
+        )
+
+    if output is not None:
+        report = {
+            **version_info(),
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "database": engine.dialect.name,
+            "parameters": {
+                "users": users,
+                "products": products,
+                "days": days,
+                "purchases_per_day": purchases_per_day,
+                "seed": seed,
+                "repeat": repeat,
+            },
+            "results": results,
+        }
+        output.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Results written to {output}")
+
+
+def run_cases(
+    sql_session: ReconnectingSession,
+    counter: QueryCounter,
+    repeat: int,
+    days: int,
+    tmpdir: Path,
+) -> dict[str, dict[str, float]]:
+    sample_users = sql_session.scalars(
+        select(User).order_by(User.credit.desc()).limit(SAMPLE_SIZE),
+    ).all()
+    sample_products = sql_session.scalars(
+        select(Product).order_by(Product.product_id).limit(SAMPLE_SIZE),
+    ).all()
+    buy_menu = BuyMenu(sql_session)
+    show_user_menu = ShowUserMenu(sql_session)
+    user_list_menu = UserListMenu(sql_session)
+    balance_menu = BalanceMenu(sql_session)
+    limit = config["limits"]["user_recent_transaction_limit"]
+
+    def scan_bar_code(i: int) -> None:
+        product = sample_products[i % len(sample_products)]
+        assert buy_menu.search_for_thing(product.bar_code) is not None
+
+    def scan_card(i: int) -> None:
+        user = sample_users[i % len(sample_users)]
+        assert buy_menu.search_for_thing(user.card) is not None
+
+    def purchase_commit(i: int) -> None:
+        # What BuyMenu does once the purchase is confirmed
+        purchase = Purchase()
+        Transaction(sample_users[i % len(sample_users)], purchase=purchase)
+        PurchaseEntry(purchase, sample_products[i % len(sample_products)], 1)
+        commit_purchase(sql_session, purchase)
+
+    def user_history(i: int) -> None:
+        "".join(show_user_menu.transaction_lines(sample_users[i % len(sample_users)], limit))
+
+    def user_list(_i: int) -> None:
+        "".join(user_list_menu.user_list_lines())
+
+    def balance(_i: int) -> None:
+        balance_menu.format_balance()
+
+    log_path = tmpdir / "bench.dibblerlog"
+    log = TransactionLog(log_path)
+    start_date = (BENCH_END - timedelta(days=days)).date().isoformat()
+    end_date = BENCH_END.date().isoformat()
+
+    def stats_build(_i: int) -> None:
+        # Start from an empty log every time, instead of only exporting what is new
+        log.path.unlink(missing_ok=True)
+        log.strings_path.unlink(missing_ok=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            buildDatabaseFromDb(4, "", "", sql_session, start_date, end_date, log_path)
+
+    cases = {
+        "scan bar code": scan_bar_code,
+        "scan card": scan_card,
+        "purchase commit": purchase_commit,
+        "user history": user_history,
+        "user list": user_list,
+        "balance": balance,
+        "stats build": stats_build,
+    }
+    results = {}
+    for name, function in cases.items():
+        print(f"Running {name}...")
+        results[name] = run_case(function, repeat, counter)
+    return results
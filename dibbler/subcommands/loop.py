@@ -12,79 +12,66 @@ from signal import (
     signal as set_signal_handler,
 )
 
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import Session
 
 from ..conf import config
+from ..lib.ledger import take_snapshots_if_due
 from ..menus import (
-    AddProductMenu,
-    AddStockMenu,
-    AddUserMenu,
-    AdjustCreditMenu,
-    AdjustStockMenu,
-    BalanceMenu,
     BuyMenu,
-    CleanupStockMenu,
-    EditProductMenu,
-    EditUserMenu,
     FAQMenu,
-    LoggedStatisticsMenu,
+    LazyMenu,
     MainMenu,
     Menu,
-    PrintLabelMenu,
-    ProductListMenu,
-    ProductPopularityMenu,
-    ProductRevenueMenu,
-    ProductSearchMenu,
-    ShowUserMenu,
-    TransferMenu,
-    UserListMenu,
 )
 
 random.seed()
 
 
-def main(sql_session: Session) -> None:
-    if not config["general"]["stop_allowed"]:
-        set_signal_handler(SIGQUIT, SIG_IGN)
+def build_main_menu(sql_session: Session) -> MainMenu:
+    """
+    Build the menu tree. Apart from the buy menu, which is used all the time,
+    the submenus are only imported and constructed when first selected.
+    """
 
-    if not config["general"]["stop_allowed"]:
-        set_signal_handler(SIGTSTP, SIG_IGN)
+    def lazy(name: str, module: str, class_name: str) -> LazyMenu:
+        return LazyMenu(name, sql_session, f"dibbler.menus.{module}", class_name)
 
     main_menu = MainMenu(
         sql_session,
         items=[
             BuyMenu(sql_session),
-            ProductListMenu(sql_session),
-            ShowUserMenu(sql_session),
-            UserListMenu(sql_session),
-            AdjustCreditMenu(sql_session),
-            TransferMenu(sql_session),
-            AddStockMenu(sql_session),
+            lazy("Product list", "miscmenus", "ProductListMenu"),
+            lazy("Show user", "miscmenus", "ShowUserMenu"),
+            lazy("User list", "miscmenus", "UserListMenu"),
+            lazy("Adjust credit", "miscmenus", "AdjustCreditMenu"),
+            lazy("Transfer credit between users", "miscmenus", "TransferMenu"),
+            lazy("Add stock and adjust credit", "addstock", "AddStockMenu"),
             Menu(
                 "Add/edit",
                 sql_session,
                 items=[
-                    AddUserMenu(sql_session),
-                    EditUserMenu(sql_session),
-                    AddProductMenu(sql_session),
-                    EditProductMenu(sql_session),
-                    AdjustStockMenu(sql_session),
-                    CleanupStockMenu(sql_session),
+                    lazy("Add user", "editing", "AddUserMenu"),
+                    lazy("Edit user", "editing", "EditUserMenu"),
+                    lazy("Add product", "editing", "AddProductMenu"),
+                    lazy("Edit product", "editing", "EditProductMenu"),
+                    lazy("Adjust stock", "editing", "AdjustStockMenu"),
+                    lazy("Stock Cleanup", "editing", "CleanupStockMenu"),
                 ],
             ),
-            ProductSearchMenu(sql_session),
+            lazy("Product search", "miscmenus", "ProductSearchMenu"),
             Menu(
                 "Statistics",
                 sql_session,
                 items=[
-                    ProductPopularityMenu(sql_session),
-                    ProductRevenueMenu(sql_session),
-                    BalanceMenu(sql_session),
-                    LoggedStatisticsMenu(sql_session),
+                    lazy("Products by popularity", "stats", "ProductPopularityMenu"),
+                    lazy("Products by revenue", "stats", "ProductRevenueMenu"),
+                    lazy("Total balance of PVVVV", "stats", "BalanceMenu"),
+                    lazy("Statistics from log", "stats", "LoggedStatisticsMenu"),
                 ],
             ),
             FAQMenu(sql_session),
-            PrintLabelMenu(sql_session),
+            lazy("Print a label", "printermenu", "PrintLabelMenu"),
         ],
         exit_msg="happy happy joy joy",
         exit_confirm_msg="Really quit Dibbler?",
@@ -93,6 +80,20 @@ def main(sql_session: Session) -> None:
         main_menu.exit_disallowed_msg = (
             "You can check out any time you like, but you can never leave."
         )
+    return main_menu
+
+
+def main(sql_session: Session, main_menu: MainMenu | None = None) -> None:
+    if not config["general"]["stop_allowed"]:
+        set_signal_handler(SIGQUIT, SIG_IGN)
+
+    if not config["general"]["stop_allowed"]:
+        set_signal_handler(SIGTSTP, SIG_IGN)
+
+    if main_menu is None:
+        main_menu = build_main_menu(sql_session)
+    # Store recent balances, so that reconciling does not sum the whole history
+    take_snapshots_if_due(sql_session)
     while True:
         # noinspection PyBroadException
         try:
@@ -101,10 +102,15 @@ def main(sql_session: Session) -> None:
             print("")
             print("Interrupted.")
         except:
-            print("Something went wrong.")
-            print(f"{sys.exc_info()[0]}: {sys.exc_info()[1]}")
-            if config["general"]["show_tracebacks"]:
-                traceback.print_tb(sys.exc_info()[2])
+            error = sys.exc_info()[1]
+            if isinstance(error, DBAPIError) and error.connection_invalidated:
+                # The session throws away the dead connection when it is reset below
+                print("Lost the connection to the database, the last action was not stored.")
+            else:
+                print("Something went wrong.")
+                print(f"{sys.exc_info()[0]}: {sys.exc_info()[1]}")
+                if config["general"]["show_tracebacks"]:
+                    traceback.print_tb(sys.exc_info()[2])
         else:
             break
         print("Restarting main menu.")
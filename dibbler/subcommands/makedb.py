@@ -2,8 +2,10 @@
 
 from sqlalchemy.engine import Engine
 
+from dibbler.lib.check_db_health import store_schema_fingerprint
 from dibbler.models import Base
 
 
 def main(engine: Engine) -> None:
     Base.metadata.create_all(engine)
+    store_schema_fingerprint(engine)
@@ -0,0 +1,41 @@
+#!/usr/bin/python
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection, Engine
+
+from dibbler.lib.check_db_health import store_schema_fingerprint
+from dibbler.models import Base
+
+
+def index_names(conn: Connection, table_name: str) -> set[str]:
+    return {index["name"] for index in inspect(conn).get_indexes(table_name)}
+
+
+def main(engine: Engine) -> None:
+    """
+    Bring an existing database up to date with the models.
+
+    `create-db` only creates tables which are missing, so this also
+    creates the indexes which have been declared since the tables
+    were created.
+    """
+    with engine.begin() as conn:
+        existing_tables = set(inspect(conn).get_table_names())
+        Base.metadata.create_all(conn)
+
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                print(f"Created table {table.name}")
+                continue
+
+            existing_indexes = index_names(conn, table.name)
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if index.name in existing_indexes:
+                    continue
+                # This is a no-op for indexes that are specific to another dialect
+                index.create(conn)
+                if index.name in index_names(conn, table.name):
+                    print(f"Created index {index.name} on {table.name}")
+
+    store_schema_fingerprint(engine)
+    print("Database is up to date")
@@ -0,0 +1,31 @@
+#!/usr/bin/python
+
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from dibbler.models import PurchaseEntry, Transaction, UserProducts
+
+
+def main(sql_session: Session) -> None:
+    """
+    Recompute every user's per-product counters from the purchase history.
+    """
+    total = func.sum(PurchaseEntry.amount)
+    sql_session.execute(delete(UserProducts))
+    sql_session.execute(
+        insert(UserProducts).from_select(
+            ["user_name", "product_id", "count", "sign"],
+            select(
+                Transaction.user_name,
+                PurchaseEntry.product_id,
+                total,
+                case((total > 0, 1), (total < 0, -1), else_=0),
+            )
+            .join(PurchaseEntry, PurchaseEntry.purchase_id == Transaction.purchase_id)
+            .group_by(Transaction.user_name, PurchaseEntry.product_id),
+        ),
+    )
+    sql_session.commit()
+
+    rows = sql_session.scalar(select(func.count()).select_from(UserProducts))
+    print(f"Rebuilt {rows} user product counters")
@@ -0,0 +1,29 @@
+#!/usr/bin/python
+
+from sqlalchemy.orm import Session
+
+from dibbler.lib.ledger import (
+    SNAPSHOT_MARGIN,
+    balances_query,
+    take_snapshots,
+    take_snapshots_if_due,
+)
+
+
+def main(sql_session: Session, snapshot: bool = False) -> None:
+    """
+    Compare every user's credit with the balance derived from their transactions.
+
+    Balance snapshots are taken afterwards if `snapshot` is set, or if the
+    latest ones are older than the interval configured under [ledger].
+    """
+    drifting = 0
+    for name, credit, balance in sql_session.execute(balances_query()):
+        if credit != balance:
+            drifting += 1
+            print(f"{name}: credit is {credit} kr, transactions sum to {balance} kr")
+    print(f"{drifting} user(s) with a credit different from their transactions")
+
+    count = take_snapshots(sql_session) if snapshot else take_snapshots_if_due(sql_session)
+    if count:
+        print(f"Took balance snapshots for {count} user(s), as of {SNAPSHOT_MARGIN} ago")
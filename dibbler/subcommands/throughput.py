@@ -0,0 +1,287 @@
+#!/usr/bin/python
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import queue
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.orm import ORMExecuteState, Session
+
+from dibbler.conf import config, config_db_string, config_engine_options, config_sqlite_pragmas
+from dibbler.lib.database import ReconnectingSession, configure_sqlite
+from dibbler.lib.helpers import search_product, search_user
+from dibbler.models import Product, Purchase, User
+
+from . import loop
+
+if TYPE_CHECKING:
+    from multiprocessing.process import BaseProcess
+    from multiprocessing.queues import Queue
+    from multiprocessing.synchronize import Barrier
+
+
+class CommitTimer:
+    """
+    Times every commit of a session which stores a purchase, from the first
+    statement storing it until the database has committed.
+    """
+
+    def __init__(self, sql_session: Session) -> None:
+        self.latencies: list[float] = []
+        self._started_at: float | None = None
+        event.listen(sql_session, "do_orm_execute", self._do_orm_execute)
+        event.listen(sql_session, "before_commit", self._before_commit)
+        event.listen(sql_session, "after_commit", self._after_commit)
+        event.listen(sql_session, "after_rollback", self._after_rollback)
+
+    def _do_orm_execute(self, state: ORMExecuteState) -> None:
+        # commit_purchase inserts the purchase itself, before committing
+        if state.is_insert and state.statement.table.name == Purchase.__tablename__:
+            self._start()
+
+    def _before_commit(self, sql_session: Session) -> None:
+        # Otherwise, the purchase is inserted by the flush
+        if any(isinstance(obj, Purchase) for obj in sql_session.new):
+            self._start()
+
+    def _start(self) -> None:
+        if self._started_at is None:
+            self._started_at = time.perf_counter()
+
+    def _after_commit(self, _sql_session: Session) -> None:
+        if self._started_at is not None:
+            self.latencies.append(time.perf_counter() - self._started_at)
+            self._started_at = None
+
+    def _after_rollback(self, _sql_session: Session) -> None:
+        self._started_at = None
+
+
+def scan_strings(sql_session: Session) -> tuple[list[str], list[str]]:
+    """
+    The strings a kiosk can be given to select a user and a product, one
+    for each user and product it is exactly matched with.
+
+    Anything else would be answered with a list to choose from, or a
+    question, which the script does not expect.
+    """
+    users = []
+    for user in sql_session.scalars(select(User)):
+        for string in (user.card, user.rfid, user.name):
+            if (
+                string
+                and search_user(string, sql_session) is user
+                and not isinstance(search_product(string, sql_session), Product)
+            ):
+                users.append(string)
+                break
+    products = []
+    for product in sql_session.scalars(select(Product).where(Product.hidden.is_(False))):
+        string = product.bar_code
+        if (
+            string
+            and search_product(string, sql_session) is product
+            and not isinstance(search_user(string, sql_session), User)
+        ):
+            products.append(string)
+    return users, products
+
+
+def write_script(
+    path: Path,
+    rng: random.Random,
+    users: list[str],
+    products: list[str],
+    purchases: int,
+) -> None:
+    """
+    Write the input of a kiosk: for each purchase a user, one to three
+    products and an empty line to confirm. The users and products are
+    given as strings from `scan_strings`.
+    """
+    with path.open("w") as f:
+        for _ in range(purchases):
+            f.write(rng.choice(users) + "\n")
+            for product in rng.sample(products, rng.randint(1, min(3, len(products)))):
+                f.write(product + "\n")
+            f.write("\n")
+
+
+def run_kiosk(
+    index: int,
+    script: Path,
+    barrier: Barrier,
+    results: Queue[tuple[int, list[float]]],
+) -> None:
+    """
+    Run the main menu of a kiosk in this process, with input from `script`
+    and the output thrown away, and report the commit latencies.
+    """
+    try:
+        engine = create_engine(config_db_string(), **config_engine_options())
+        if engine.dialect.name == "sqlite":
+            configure_sqlite(engine, config_sqlite_pragmas())
+        sql_session = ReconnectingSession(
+            engine,
+            expire_on_commit=False,
+            autocommit=False,
+            autoflush=False,
+            close_resets_only=True,
+        )
+        timer = CommitTimer(sql_session)
+
+        # Nobody is there to answer the low credit warning
+        config["limits"]["low_credit_warning_limit"] = -sys.maxsize
+        main_menu = loop.build_main_menu(sql_session)
+        # Leave the main menu at the end of the script
+        main_menu.exit_disallowed_msg = None
+        main_menu.exit_confirm_msg = None
+    except:
+        # Do not leave the other kiosks waiting for this one
+        barrier.abort()
+        raise
+
+    with script.open() as stdin, Path(os.devnull).open("w") as devnull:
+        sys.stdin = stdin
+        sys.stdout = devnull
+        barrier.wait()
+        loop.main(sql_session, main_menu)
+    sql_session.close()
+    engine.dispose()
+    results.put((index, timer.latencies))
+
+
+def main(
+    kiosks: int = 4,
+    purchases: int = 100,
+    seed: int = 0,
+    output: Path | None = None,
+    assume_yes: bool = False,
+    timeout: float = 600,
+) -> None:
+    """
+    Run `kiosks` main menus in parallel processes against the configured
+    database, each buying `purchases` times from scripted input, and report
+    the purchases per second and the commit latencies.
+
+    Kiosks which have not finished after `timeout` seconds are stopped. The
+    purchases stored are counted in the database, and any short of the
+    number asked for are reported as failed.
+    """
+    engine = create_engine(config_db_string(), **config_engine_options())
+    with Session(engine) as sql_session:
+        users, products = scan_strings(sql_session)
+        purchases_before = sql_session.scalar(select(func.count()).select_from(Purchase))
+    # The kiosks make their own connections, which must not be shared with this process
+    engine.dispose()
+    if not users or not products:
+        print(
+            "The database needs at least one user and one product which can be "
+            "selected by card, RFID, name or bar code without asking",
+        )
+        return
+
+    print(f"This stores {kiosks * purchases} purchases in {engine.url!r}.")
+    if not assume_yes and input("Continue? [y/N] ").strip().lower() not in ("y", "yes"):
+        return
+
+    rng = random.Random(seed)
+    context = multiprocessing.get_context("fork")
+    barrier = context.Barrier(kiosks + 1)
+    results = context.Queue()
+    with tempfile.TemporaryDirectory(prefix="dibbler-throughput-") as tmpdir:
+        processes = []
+        for i in range(kiosks):
+            script = Path(tmpdir) / f"kiosk-{i}.txt"
+            write_script(script, rng, users, products, purchases)
+            process = context.Process(target=run_kiosk, args=(i, script, barrier, results))
+            process.start()
+            processes.append(process)
+
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            print("A kiosk failed to start")
+            for process in processes:
+                process.terminate()
+            return
+        started_at = time.perf_counter()
+        latencies, failed_kiosks = collect_results(processes, results, started_at + timeout)
+        elapsed = time.perf_counter() - started_at
+        for process in processes:
+            process.join()
+
+    with Session(engine) as sql_session:
+        stored = sql_session.scalar(select(func.count()).select_from(Purchase)) - purchases_before
+    engine.dispose()
+    failures = max(kiosks * purchases - stored, 0)
+
+    report: dict[str, Any] = {
+        "database": engine.dialect.name,
+        "kiosks": kiosks,
+        "failed_kiosks": failed_kiosks,
+        "purchases": stored,
+        "failed_purchases": failures,
+        "seconds": elapsed,
+        "purchases_per_second": stored / elapsed,
+    }
+    if len(latencies) >= 2:
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        report["commit_p50_ms"] = statistics.median(latencies) * 1000
+        report["commit_p99_ms"] = percentiles[98] * 1000
+        report["commit_max_ms"] = max(latencies) * 1000
+
+    print(f"{stored} purchases by {kiosks} kiosks in {elapsed:.2f} s")
+    print(f"{report['purchases_per_second']:.1f} purchases/s, {failures} failed")
+    if failed_kiosks:
+        print(f"{failed_kiosks} kiosk(s) crashed or did not finish in {timeout:g} s")
+    if "commit_p50_ms" in report:
+        print(
+            f"Commit latency: p50 {report['commit_p50_ms']:.2f} ms, "
+            f"p99 {report['commit_p99_ms']:.2f} ms, max {report['commit_max_ms']:.2f} ms",
+        )
+    if output is not None:
+        output.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Results written to {output}")
+
+
+def collect_results(
+    processes: list[BaseProcess],
+    results: Queue[tuple[int, list[float]]],
+    deadline: float,
+) -> tuple[list[float], int]:
+    """
+    Wait for the kiosks to report their commit latencies, and return the
+    latencies and the number of kiosks which crashed or were still running
+    at `deadline`, and were stopped.
+    """
+    latencies: list[float] = []
+    pending = set(range(len(processes)))
+    failed = 0
+    while pending:
+        try:
+            index, kiosk_latencies = results.get(timeout=1)
+        except queue.Empty:
+            # A kiosk which exited normally has reported, even if it has not arrived yet
+            crashed = {i for i in pending if processes[i].exitcode not in (None, 0)}
+            failed += len(crashed)
+            pending -= crashed
+            if pending and time.perf_counter() > deadline:
+                for i in pending:
+                    processes[i].terminate()
+                failed += len(pending)
+                pending.clear()
+            continue
+        pending.discard(index)
+        latencies += kiosk_latencies
+    return latencies, failed
@@ -32,6 +32,7 @@ python3Packages.buildPythonApplication {
   propagatedBuildInputs = with python3Packages; [
     # brother-ql
     # matplotlib
+    numpy
     psycopg2-binary
     # python-barcode
     sqlalchemy